@@ -1,57 +1,164 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, g, Response
 from flask_cors import CORS
 from modules.book_processor import BookProcessor
 from modules.character import CharacterExtractor
 from modules.emotion import PsiEmotionEngine
 from modules.memory import MemoryManager
+from modules.ingest import IngestManager
 from services.qdrant import QdrantManager
+from services.llm import get_provider
+from services.embeddings import GeminiEmbedder
+from services.state import get_state_store
+from services import telemetry
 from config import Config
-import google.generativeai as genai
-import PyPDF2
+import asyncio
+import io
 import re
 import json
 import ast
+import logging
+import os
+import threading
+import time
+import uuid
 
 app = Flask(__name__)
 CORS(app)
-characters = []  # Preserve global state
 
 # Initialization Functions
 def initialize_components():
-    genai.configure(api_key=Config.GEMINI_API_KEY)
+    Config.validate()
+    get_provider()
+    qdrant = QdrantManager()
+    book_processor = BookProcessor()
+    character_extractor = CharacterExtractor()
     return {
-        'book_processor': BookProcessor(),
-        'character_extractor': CharacterExtractor(),
-        'qdrant': QdrantManager(),
-        'memory': MemoryManager()
+        'book_processor': book_processor,
+        'character_extractor': character_extractor,
+        'qdrant': qdrant,
+        'memory': MemoryManager(long_term=qdrant),
+        'ingest': IngestManager(qdrant, book_processor, character_extractor)
     }
 
-components = initialize_components()
+_components = None
+_components_lock = threading.Lock()
+warmup_state = {"status": "cold", "error": None, "init_seconds": None}
+
+def _set_warmup(**state):
+    warmup_state.update(**state)
+    telemetry.WORKER_READY.set(1 if warmup_state["status"] == "ready" else 0, pid=os.getpid())
+    telemetry.flush()
+
+def get_components():
+    """Initialize components on first use; later calls return the same instances."""
+    global _components
+    if _components is None:
+        with _components_lock:
+            if _components is None:
+                _set_warmup(status="warming", error=None)
+                start = time.perf_counter()
+                try:
+                    _components = initialize_components()
+                except Exception as e:
+                    _set_warmup(status="error", error=str(e))
+                    raise
+                _set_warmup(status="ready", init_seconds=round(time.perf_counter() - start, 3))
+                logging.info(f"Components initialized in {warmup_state['init_seconds']}s")
+    return _components
+
+def reset_components():
+    """Drop initialized components so the next use rebuilds them (e.g. a fresh in-memory Qdrant)."""
+    global _components
+    with _components_lock:
+        _components = None
+        GeminiEmbedder.clear_cache()
+        _set_warmup(status="cold", error=None, init_seconds=None)
+
+def _warm_up():
+    try:
+        get_components()
+    except Exception as e:
+        logging.error(f"Warm-up failed: {e}")
+
+def start_warmup():
+    """Initialize components in a background thread unless already ready or warming."""
+    if warmup_state["status"] in ("cold", "error"):
+        threading.Thread(target=_warm_up, daemon=True).start()
+
+# Shared State Functions
+def load_characters():
+    return get_state_store().get("characters", [])
+
+def save_characters(characters):
+    get_state_store().set("characters", characters)
+
+def character_passage_count(name):
+    return get_state_store().set_size(f"character_index:{name}")
+
+def save_character_index(character_index):
+    """Merge a book's {character name: [chunk ids]} into the shared index, one set per character."""
+    store = get_state_store()
+    for name, point_ids in character_index.items():
+        store.add_to_set(f"character_index:{name}", point_ids)
 
 # PDF Handling Functions
-def handle_pdf_upload(pdf_file):
-    book_text = extract_pdf_text(pdf_file)
+async def handle_pdf_upload(pdf_file):
+    pdf_bytes = await asyncio.to_thread(pdf_file.read)
+    components = await asyncio.to_thread(get_components)
+    ingest = components['ingest']
+
+    # Ingest is keyed by PDF hash: a finished book returns at once, an interrupted one resumes
+    manifest = await asyncio.to_thread(ingest.begin, pdf_bytes)
+    if manifest["status"] == "complete":
+        if manifest.get("character_index"):
+            await asyncio.to_thread(save_character_index, manifest["character_index"])
+        return manifest["characters"]
+    book_text = await asyncio.to_thread(
+        ingest.load_text, manifest, pdf_bytes, lambda data: extract_pdf_text(io.BytesIO(data))
+    )
     if not book_text.strip():
         return None
+
+    async def index_book():
+        # Detect chapters and chunk once; chunk storage and the chapter index share the result
+        chapters, chunks = await asyncio.to_thread(ingest.split, book_text)
+        await asyncio.gather(
+            asyncio.to_thread(ingest.index_chunks, manifest, chunks),
+            asyncio.to_thread(ingest.index_chapters, manifest, book_text, chapters)
+        )
+        return chunks
+
+    # Indexing and character extraction are independent, so run them concurrently
+    chunks, processed_chars = await asyncio.gather(
+        index_book(),
+        asyncio.to_thread(ingest.extract_characters, manifest, book_text)
+    )
     
-    components['qdrant'].store_chunks(components['book_processor'].process_book(book_text))
-    extracted_chars = components['character_extractor'].extract(book_text)
-    processed_chars = [char.model_dump() for char in extracted_chars]
-    
-    components['qdrant'].store_chunks(
-        [{"text": f"{char}"} for char in processed_chars],
-        collection="characters"
+    # Tag chunks with the characters they mention once both are known
+    character_index, _ = await asyncio.gather(
+        asyncio.to_thread(ingest.index_characters, manifest, chunks, processed_chars),
+        asyncio.to_thread(
+            components['qdrant'].store_chunks,
+            [{"text": f"{char}"} for char in processed_chars],
+            collection="characters"
+        )
     )
+    await asyncio.to_thread(save_character_index, character_index)
+    await asyncio.to_thread(ingest.complete, manifest)
     return processed_chars
 
 def extract_pdf_text(pdf_file):
     text = ""
     try:
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
+        import PyPDF2  # deferred: only needed for uploads
+        with telemetry.span("pdf_extract"):
+            pdf_reader = PyPDF2.PdfReader(pdf_file)
+            for page in pdf_reader.pages:
+                # A form-feed line marks the page break, so chapter detection can anchor headings
+                # that open a page; a plain blank line would read as a paragraph break to the splitter
+                text += page.extract_text().rstrip("\n") + "\n\f\n"
     except Exception as e:
-        print(f"Error extracting PDF text: {e}")
+        logging.error(f"Error extracting PDF text: {e}")
     return text
 
 def parser(text: str):
@@ -75,11 +182,11 @@ def match_character(message, characters):
     """
     
     try:
-        model = genai.GenerativeModel('gemini-2.0-flash')
-        response = model.generate_content(prompt)
-        print(f"Auto matching prompt: {response.text}")
+        with telemetry.span("character_match"):
+            response_text = get_provider().generate(prompt, model='gemini-2.0-flash')
+        logging.debug(f"Auto matching response: {response_text}")
 
-        match_data = parser(response.text)
+        match_data = parser(response_text)
         
         
         if match_data.get('match'):
@@ -87,7 +194,7 @@ def match_character(message, characters):
             confidence = match_data.get('confidence', 0.0)
             return character, confidence
     except Exception as e:
-        print(f"Auto matching failed: {e}")
+        logging.warning(f"Auto matching failed: {e}")
     
     # Fallback to simple name matching
     for char in characters:
@@ -97,130 +204,196 @@ def match_character(message, characters):
 
 # Chat Processing Functions
 def handle_character_retrieval(message):
-    global characters
     try:
-        print("Retrieving characters from memory....")
-        character_memories = components['qdrant'].retrieve_memory(
+        logging.info("Retrieving characters from memory")
+        character_memories = get_components()['qdrant'].retrieve_memory(
             query=message, 
             similarity_threshold=0.7,
             collection="characters"
         )
         try:
             characters = [ast.literal_eval(cm) for cm in character_memories]
-            print(f"Retrieved characters from memory: {characters}")
+            logging.info(f"Retrieved {len(characters)} characters from memory")
+            save_characters(characters)
+            return characters
         except (ValueError, SyntaxError) as e:
-            print(f"Error parsing characters: {e}")
-        return True
+            logging.error(f"Error parsing characters: {e}")
     except Exception as e:
-        print(f"No characters found in memory: {e}")
-        return False
+        logging.warning(f"No characters found in memory: {e}")
+    return []
+
+def retrieve_knowledge(message, character):
+    """Retrieve context for a character turn, scoped to passages mentioning the character when indexed."""
+    qdrant = get_components()['qdrant']
+    if character_passage_count(character["name"]) >= Config.CHARACTER_MIN_PASSAGES:
+        return qdrant.retrieve_memory(query=message, character=character["name"])
+    return qdrant.retrieve_memory(query=message, top_chapters=Config.RETRIEVAL_TOP_CHAPTERS)
 
 def generate_fallback_response(message):
     prompt = f"You are a helpful assistant. User: {message}"
-    model = genai.GenerativeModel('gemini-2.0-flash')
-    response = model.generate_content(prompt)
-    return jsonify({"response": response.text})
+    with telemetry.span("generation"):
+        response_text = get_provider().generate(prompt, model='gemini-2.0-flash')
+    return response_text
 
-def create_conversation_prompt(current_character, emotion_engine, knowledge, message):
+def create_conversation_prompt(current_character, emotion_engine, knowledge, message, history):
     return f"""
     You are {current_character['name']}. 
     Personality: {current_character['summary']}
     Current emotion: {emotion_engine.state['emotion']}
     History and knowledge: {knowledge}
     Conversation history:
-    {components['memory'].memory.messages}
+    {history}
     
     User: {message}
     {current_character['name']}:
     """
 
-def handle_chat_interaction(message):
-    global characters
-    
-    # Try to match character from message
-    current_character, confidence = match_character(message, characters)
+def infer_character_from_history(characters, history):
+    """Identify the addressed character from the conversation history, or None."""
+    character_list = "\n".join([f"- {c['name']}: {c['summary']}" for c in characters])
+    prompt = f"""
+        Identify which character, if any, is being addressed in the conversation history.
+
+        Conversation history:
+        {history}
+
+        Available characters:
+        {character_list}
+
+        Instructions:
+        - Analyze the entire conversation history to determine the character being addressed.
+        - Look for direct name mentions, contextual clues, or references to traits or events associated with the characters based on their summaries.
+        - If multiple characters could be matches, select the one that is most directly addressed or most relevant to the context.
+        - If no character is being addressed, respond with {{ "match": null, "confidence": 0.0 }}.
+        - Use the character summaries to inform your decision when the conversation lacks explicit names.
+
+        Response format:
+        Respond with a JSON object containing the matched character's name (or null) and a confidence score between 0.0 and 1.0.
+
+        Example:
+        Conversation history: "Hey Tessie, how are you?"
+        Available characters:
+        - Tessie Hutchinson: The lottery's winner.
+        - Bill Hutchinson: Tessie's husband.
+        Response: {{ "match": "Tessie Hutchinson", "confidence": 1.0 }}
+
+        Respond only with the JSON object in your final output.
+    """
+    try:
+        with telemetry.span("history_inference"):
+            response_text = get_provider().generate(prompt, model='gemini-2.0-flash')
+        logging.debug(f"Character inference response: {response_text}")
+        match_data = parser(response_text)
+        
+        if match_data.get('match'):
+            current_character = next((c for c in characters if c['name'].lower() == match_data['match'].lower()), None)
+            confidence = match_data.get('confidence', 0.0)
+            if current_character and confidence >= 0.3:
+                pass  # Use this character
+            else:
+                current_character = None
+        else:
+            current_character = None
+    except Exception as e:
+        logging.warning(f"Error inferring character from history: {e}")
+        current_character = None
+    return current_character
+
+async def handle_chat_interaction(message, characters, session_id="default"):
+    components = await asyncio.to_thread(get_components)
+
+    # Try to match character from message while loading the session history
+    (current_character, confidence), history = await asyncio.gather(
+        asyncio.to_thread(match_character, message, characters),
+        asyncio.to_thread(components['memory'].history, session_id)
+    )
     if current_character and confidence >= 0.3:
         pass  # Use this character
     else:
         # Try to infer from conversation history
-        character_list = "\n".join([f"- {c['name']}: {c['summary']}" for c in characters])
-        prompt = f"""
-            Identify which character, if any, is being addressed in the conversation history.
-
-            Conversation history:
-            {components['memory'].memory.messages}
-
-            Available characters:
-            {character_list}
-
-            Instructions:
-            - Analyze the entire conversation history to determine the character being addressed.
-            - Look for direct name mentions, contextual clues, or references to traits or events associated with the characters based on their summaries.
-            - If multiple characters could be matches, select the one that is most directly addressed or most relevant to the context.
-            - If no character is being addressed, respond with {{ "match": null, "confidence": 0.0 }}.
-            - Use the character summaries to inform your decision when the conversation lacks explicit names.
-
-            Response format:
-            Respond with a JSON object containing the matched character's name (or null) and a confidence score between 0.0 and 1.0.
-
-            Example:
-            Conversation history: "Hey Tessie, how are you?"
-            Available characters:
-            - Tessie Hutchinson: The lottery's winner.
-            - Bill Hutchinson: Tessie's husband.
-            Response: {{ "match": "Tessie Hutchinson", "confidence": 1.0 }}
-
-            Respond only with the JSON object in your final output.
-        """
-        try:
-            response = genai.GenerativeModel('gemini-2.0-flash').generate_content(prompt)
-            print(f"Character inference prompt: {response.text}")
-            match_data = parser(response.text)
-            
-            if match_data.get('match'):
-                current_character = next((c for c in characters if c['name'].lower() == match_data['match'].lower()), None)
-                confidence = match_data.get('confidence', 0.0)
-                if current_character and confidence >= 0.3:
-                    pass  # Use this character
-                else:
-                    current_character = None
-            else:
-                current_character = None
-        except Exception as e:
-            print(f"Error inferring character from history: {e}")
-            current_character = None
+        current_character = await asyncio.to_thread(infer_character_from_history, characters, history.messages)
     
     if not current_character:
         # Fallback to general AI assistant
-        return generate_fallback_response(message)
+        response_text = await asyncio.to_thread(generate_fallback_response, message)
+        return jsonify({"response": response_text})
     
-    # Proceed with character-based response
+    # Proceed with character-based response; sentiment and retrieval are independent
     emotion_engine = PsiEmotionEngine(current_character["traits"])
-    emotion_engine.update(message)
-    knowledge = components['qdrant'].retrieve_memory(query=message)
-    prompt = create_conversation_prompt(current_character, emotion_engine, knowledge, message)
-    response = genai.GenerativeModel('gemini-2.0-flash').generate_content(prompt)
-    components['memory'].memory_execute(
+    _, knowledge = await asyncio.gather(
+        asyncio.to_thread(emotion_engine.update, message),
+        asyncio.to_thread(retrieve_knowledge, message, current_character)
+    )
+    prompt = create_conversation_prompt(current_character, emotion_engine, knowledge, message, history.messages)
+    with telemetry.span("generation"):
+        response_text = await asyncio.to_thread(get_provider().generate, prompt, model='gemini-2.0-flash')
+    await asyncio.to_thread(
+        components['memory'].memory_execute,
         user_message=message,
         responder=current_character["name"],
-        bot_response=response.text
+        bot_response=response_text,
+        session_id=session_id
     )
     return jsonify({
-        "response": response.text,
+        "response": response_text,
         "character": current_character["name"],
         "emotion": emotion_engine.state
     })
 
+@app.before_request
+def start_request_trace():
+    g.request_start = time.perf_counter()
+    g.trace = telemetry.start_trace()
+
+@app.after_request
+def set_session_cookie(response):
+    if 'new_session_id' in g:
+        response.set_cookie('session_id', g.new_session_id, httponly=True, samesite='Lax')
+    return response
+
+@app.after_request
+def record_request_metrics(response):
+    if 'request_start' in g:
+        elapsed = time.perf_counter() - g.request_start
+        telemetry.REQUEST_SECONDS.observe(
+            elapsed,
+            endpoint=request.endpoint or "unknown",
+            method=request.method,
+            status=response.status_code
+        )
+        if Config.TIMING_HEADER or request.headers.get('X-Debug-Timing') == '1':
+            response.headers['Server-Timing'] = telemetry.server_timing(g.trace + [("total", elapsed)])
+    return response
+
+@app.route('/ready')
+def ready():
+    start_warmup()
+    body = dict(warmup_state, pid=os.getpid())
+    is_ready = warmup_state["status"] == "ready"
+    if Config.METRICS_DIR:
+        # Requests reach an arbitrary worker, so report every worker that exported recently
+        workers = telemetry.worker_readiness(Config.METRICS_DIR, max_age=3 * Config.METRICS_FLUSH_SECONDS)
+        workers[str(os.getpid())] = is_ready
+        body["workers"] = workers
+        is_ready = all(workers.values())
+    return jsonify(body), 200 if is_ready else 503
+
+@app.route('/metrics')
+def metrics():
+    return Response(telemetry.REGISTRY.render(Config.METRICS_DIR or None), mimetype='text/plain; version=0.0.4')
+
 @app.route('/')
 def index():
     return render_template('index.html')
 # Main Route
 @app.route('/chat', methods=['POST'])
-def chat():
-    global characters
-    
+async def chat():
     message = request.form.get('message')
     pdf_file = request.files.get('pdf_file')
+    session_id = request.form.get('session_id') or request.cookies.get('session_id')
+    if not session_id:
+        # Give each browser its own conversation; set_session_cookie sends the id back
+        session_id = g.new_session_id = uuid.uuid4().hex
 
     if not message and not pdf_file:
         return jsonify({"error": "No message or PDF file provided"}), 400
@@ -229,9 +402,10 @@ def chat():
         if not pdf_file.filename.endswith('.pdf'):
             return jsonify({"error": "File must be a PDF"}), 400
         
-        characters = handle_pdf_upload(pdf_file)
+        characters = await handle_pdf_upload(pdf_file)
         if not characters:
             return jsonify({"error": "No text extracted from PDF"}), 400
+        await asyncio.to_thread(save_characters, characters)
         
         return jsonify({
             "response": "PDF uploaded and characters extracted.",
@@ -239,12 +413,14 @@ def chat():
         })
 
     # If no characters are loaded, attempt to retrieve from memory
+    characters = await asyncio.to_thread(load_characters)
     if not characters:
-        handle_character_retrieval(message)
+        characters = await asyncio.to_thread(handle_character_retrieval, message)
 
     
     # Handle the chat interaction, which will fall back to general AI if necessary
-    return handle_chat_interaction(message)
+    return await handle_chat_interaction(message, characters, session_id)
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    start_warmup()
+    app.run(debug=Config.DEBUG, port=5000)
\ No newline at end of file
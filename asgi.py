@@ -0,0 +1,19 @@
+"""
+ASGI entrypoint for production serving with multiple workers, e.g.:
+
+    STATE_STORE_URL=redis://localhost:6379/0 uvicorn asgi:app --workers 4 --port 8000
+
+Workers share characters and chat history through the state store, so any
+worker behind the load balancer can serve any request. Within a worker, requests
+run concurrently on a thread pool of ASGI_THREADS threads. With METRICS_DIR set,
+every worker exports its metrics there and /metrics and /ready report all workers.
+"""
+from a2wsgi import WSGIMiddleware
+from app import app as flask_app, start_warmup
+from config import Config
+from services import telemetry
+
+if Config.METRICS_DIR:
+    telemetry.start_exporter(Config.METRICS_DIR, interval=Config.METRICS_FLUSH_SECONDS)
+start_warmup()
+app = WSGIMiddleware(flask_app, workers=Config.ASGI_THREADS)
@@ -0,0 +1,205 @@
+"""
+Shared helpers for the benchmark suite: local stand-ins for Gemini and Qdrant,
+synthetic books and PDFs, stage timers and latency statistics.
+"""
+import contextlib
+import io
+import json
+import logging
+import math
+import os
+import random
+import shutil
+import tempfile
+
+# Benchmarks always run against local stand-ins unless explicitly overridden.
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ.setdefault("QDRANT_URL", ":memory:")
+
+from services.llm import FakeProvider
+
+CHARACTERS = [
+    {"name": "Alice Thorn", "traits": {"arousal": 0.7, "valence": 0.4}, "summary": "A restless cartographer searching for her brother", "aliases": ["Alice"]},
+    {"name": "Bram Keller", "traits": {"arousal": 0.3, "valence": 0.8}, "summary": "A gentle innkeeper who hides a violent past", "aliases": ["Bram"]},
+    {"name": "Cora Vale", "traits": {"arousal": 0.5, "valence": 0.2}, "summary": "A bitter magistrate ruling the river town", "aliases": ["Cora"]},
+]
+
+WORDS = (
+    "river town lantern map storm bridge letter harvest market winter forest road "
+    "secret brother inn magistrate fire silver bell tower garden stone ship night "
+    "morning promise debt crown shadow voice window door field mountain song"
+).split()
+
+
+def fake_rules() -> list[tuple[str, str]]:
+    """Canned replies so every prompt in the pipeline parses as it would with Gemini."""
+    return [
+        (r"Extract characters from this text", json.dumps(CHARACTERS)),
+        (r"identify which character", json.dumps({"match": CHARACTERS[0]["name"], "confidence": 0.9})),
+        (r"Identify which character, if any", json.dumps({"match": CHARACTERS[0]["name"], "confidence": 0.9})),
+        (r"Analyze the sentiment", json.dumps({"polarity": 0.3, "intensity": 0.6})),
+    ]
+
+
+def make_provider(generate_latency: str = "0", embed_latency: str = "0", seed: int = 0) -> FakeProvider:
+    return FakeProvider(
+        generate_latency=generate_latency,
+        embed_latency=embed_latency,
+        rules=fake_rules(),
+        seed=seed
+    )
+
+
+def synthetic_book(chapters: int, paragraphs_per_chapter: int = 8, seed: int = 0) -> str:
+    """Deterministic book text with chapter headings and character mentions."""
+    rng = random.Random(seed)
+    names = [c["name"] for c in CHARACTERS]
+    parts = []
+    for number in range(1, chapters + 1):
+        parts.append(f"Chapter {number}")
+        for _ in range(paragraphs_per_chapter):
+            sentences = []
+            for _ in range(rng.randint(4, 8)):
+                words = rng.choices(WORDS, k=rng.randint(8, 16))
+                if rng.random() < 0.4:
+                    words.insert(rng.randrange(len(words)), rng.choice(names))
+                sentence = " ".join(words)
+                # Upper-case the first letter only; str.capitalize() would lower-case the names
+                sentences.append(sentence[0].upper() + sentence[1:] + ".")
+            parts.append(" ".join(sentences))
+    return "\n\n".join(parts)
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def synthetic_pdf(text: str, lines_per_page: int = 50, line_width: int = 90,
+                  chapter_pages: bool = False) -> tuple[bytes, int]:
+    """
+    Render plain text into a minimal Helvetica PDF. Returns (pdf bytes, page count).
+    Chapters run on mid-page unless `chapter_pages` starts every "Chapter" heading on a new page.
+    """
+    pages, page = [], []
+    for paragraph in text.split("\n"):
+        if chapter_pages and paragraph.startswith("Chapter ") and any(page):
+            pages.append(page)
+            page = []
+        lines = []
+        while len(paragraph) > line_width:
+            cut = paragraph.rfind(" ", 0, line_width)
+            cut = cut if cut > 0 else line_width
+            lines.append(paragraph[:cut])
+            paragraph = paragraph[cut:].lstrip()
+        lines.append(paragraph)
+        for line in lines:
+            if len(page) == lines_per_page:
+                pages.append(page)
+                page = []
+            page.append(line)
+    pages.append(page)
+
+    objects = []
+    page_ids = []
+    font_id = 3
+    next_id = 4
+    for page_lines in pages:
+        stream = "BT /F1 10 Tf 12 TL 40 800 Td " + " ".join(f"({_pdf_escape(l)}) Tj T*" for l in page_lines) + " ET"
+        content_id, page_id = next_id, next_id + 1
+        next_id += 2
+        objects.append((content_id, f"<< /Length {len(stream.encode('latin-1', 'replace'))} >>\nstream\n{stream}\nendstream"))
+        objects.append((page_id, f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+                                 f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {content_id} 0 R >>"))
+        page_ids.append(page_id)
+    objects.insert(0, (font_id, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"))
+    objects.insert(0, (2, f"<< /Type /Pages /Kids [{' '.join(f'{p} 0 R' for p in page_ids)}] /Count {len(page_ids)} >>"))
+    objects.insert(0, (1, "<< /Type /Catalog /Pages 2 0 R >>"))
+    objects.sort()
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = {}
+    for obj_id, body in objects:
+        offsets[obj_id] = out.tell()
+        out.write(f"{obj_id} 0 obj\n{body}\nendobj\n".encode("latin-1", "replace"))
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for obj_id, _ in objects:
+        out.write(f"{offsets[obj_id]:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue(), len(pages)
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(samples: list[float]) -> dict:
+    """Latency summary in milliseconds."""
+    return {
+        "count": len(samples),
+        "mean_ms": round(1000 * sum(samples) / len(samples), 3) if samples else 0.0,
+        "p50_ms": round(1000 * percentile(samples, 50), 3),
+        "p95_ms": round(1000 * percentile(samples, 95), 3),
+        "p99_ms": round(1000 * percentile(samples, 99), 3),
+        "max_ms": round(1000 * max(samples), 3) if samples else 0.0,
+    }
+
+
+class StageTimer:
+    """Collects per-stage durations, grouped by stage name."""
+
+    def __init__(self):
+        self.samples = {}
+
+    def record(self, stage: str, seconds: float) -> None:
+        self.samples.setdefault(stage, []).append(seconds)
+
+    def record_server_timing(self, header: str) -> None:
+        """Record every entry of a Server-Timing header (`stage;dur=<ms>, ...`)."""
+        for entry in filter(None, (part.strip() for part in header.split(","))):
+            stage, _, params = entry.partition(";")
+            for param in params.split(";"):
+                key, _, value = param.partition("=")
+                if key.strip() == "dur":
+                    self.record(stage.strip(), float(value) / 1000.0)
+
+    def summary(self) -> dict:
+        return {stage: summarize(values) for stage, values in sorted(self.samples.items())}
+
+
+@contextlib.contextmanager
+def fresh_app():
+    """
+    Rebuild the app's components (a new in-memory Qdrant) with a temporary ingest directory,
+    so nothing from an earlier run is resumed. The directory is removed afterwards.
+    """
+    import app
+
+    previous = app.Config.INGEST_DIR
+    ingest_dir = tempfile.mkdtemp(prefix="bench-ingest-")
+    app.Config.INGEST_DIR = ingest_dir
+    app.reset_components()
+    try:
+        yield app
+    finally:
+        app.Config.INGEST_DIR = previous
+        app.reset_components()
+        shutil.rmtree(ingest_dir, ignore_errors=True)
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silence module logging and stray prints so they do not skew timings."""
+    previous = logging.root.manager.disable
+    logging.disable(logging.CRITICAL)
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            yield
+    finally:
+        logging.disable(previous)
@@ -0,0 +1,215 @@
+"""
+Load-test scenario: /chat throughput as the number of ASGI workers grows.
+
+For each worker count, starts `uvicorn asgi:app --workers N` with the fake Gemini
+provider (simulated latency, canned replies for every pipeline prompt) and a shared
+SQLite state store, uploads a synthetic book through /chat, then drives the server
+with concurrent clients for a fixed duration and reports requests/s and latency
+percentiles.
+
+Pass `--qdrant-url http://host:6333` (or set QDRANT_URL) to share one Qdrant server
+between the workers, as in production. With the default ":memory:" every worker has a
+private in-process Qdrant: the book lands in whichever worker served the upload, so
+the others retrieve from an empty store and the results do not model shared state.
+
+By default the client count is twice the server's request threads (ASGI_THREADS x
+workers) so every worker is saturated. Each run reports the client process's CPU
+utilization; a client-bound run (the load generator itself near one busy core)
+understates server throughput.
+
+Usage:
+    python -m benchmarks.load_test --workers 1,2,4 --duration 20 --qdrant-url http://localhost:6333
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+
+sys.path.append('.')
+from benchmarks import harness
+
+CLIENT_BOUND_UTILIZATION = 0.8
+
+
+def _post_chat(base_url: str, message: str, session_id: str, timeout: float = 60.0) -> int:
+    data = urllib.parse.urlencode({"message": message, "session_id": session_id}).encode()
+    with urllib.request.urlopen(f"{base_url}/chat", data=data, timeout=timeout) as response:
+        response.read()
+        return response.status
+
+
+def _post_pdf(base_url: str, pdf_bytes: bytes, timeout: float = 600.0) -> dict:
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"pdf_file\"; filename=\"book.pdf\"\r\n"
+        f"Content-Type: application/pdf\r\n\r\n"
+    ).encode() + pdf_bytes + f"\r\n--{boundary}--\r\n".encode()
+    request = urllib.request.Request(
+        f"{base_url}/chat", data=body,
+        headers={"Content-Type": f"multipart/form-data; boundary={boundary}"}
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def _wait_ready(base_url: str, server: subprocess.Popen, timeout: float) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode}")
+        try:
+            with urllib.request.urlopen(f"{base_url}/ready", timeout=2) as response:
+                if response.status == 200:
+                    return
+        except (urllib.error.URLError, ConnectionError):
+            pass
+        time.sleep(0.25)
+    raise TimeoutError(f"Server at {base_url} not ready after {timeout}s")
+
+
+def _drive(base_url: str, concurrency: int, duration: float) -> dict:
+    names = [c["name"] for c in harness.CHARACTERS]
+    latencies, errors = [], []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(worker_id: int):
+        turn = 0
+        while time.perf_counter() < deadline:
+            message = f"{names[turn % len(names)]}, tell me about the {harness.WORDS[(worker_id + turn) % len(harness.WORDS)]}."
+            start = time.perf_counter()
+            try:
+                _post_chat(base_url, message, session_id=f"load-{worker_id}")
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+            turn += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    start, cpu_start = time.perf_counter(), time.process_time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    # Client threads share one interpreter lock, so ~1.0 means the load generator is the bottleneck
+    utilization = (time.process_time() - cpu_start) / elapsed
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "error_samples": sorted(set(errors))[:3],
+        "requests_per_s": round(len(latencies) / elapsed, 3),
+        "latency": harness.summarize(latencies),
+        "client_cpu_utilization": round(utilization, 3),
+        "client_bound": utilization >= CLIENT_BOUND_UTILIZATION,
+    }
+
+
+def run_scenario(workers: int, args, pdf_bytes: bytes) -> dict:
+    work_dir = tempfile.mkdtemp(prefix="loadtest-")
+    rules_path = os.path.join(work_dir, "fake_rules.json")
+    with open(rules_path, "w", encoding="utf-8") as f:
+        json.dump(harness.fake_rules(), f)
+    env = dict(
+        os.environ,
+        LLM_PROVIDER="fake",
+        FAKE_RULES=rules_path,
+        QDRANT_URL=args.qdrant_url,
+        STATE_STORE_URL=f"sqlite:///{os.path.join(work_dir, 'state.db')}",
+        INGEST_DIR=os.path.join(work_dir, "ingest"),
+        ASGI_THREADS=str(args.threads),
+        FAKE_GENERATE_LATENCY=args.generate_latency,
+        FAKE_EMBED_LATENCY=args.embed_latency,
+    )
+    concurrency = args.concurrency or 2 * args.threads * workers
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "asgi:app", "--workers", str(workers),
+         "--port", str(args.port), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        _wait_ready(base_url, server, timeout=120)
+        upload = _post_pdf(base_url, pdf_bytes)
+        if not upload.get("characters"):
+            raise RuntimeError(f"Book upload failed: {upload}")
+        _drive(base_url, concurrency, args.warmup)  # let every worker initialize
+        result = _drive(base_url, concurrency, args.duration)
+        result.update(concurrency=concurrency, server_threads=args.threads * workers)
+        return result
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="/chat throughput versus worker count")
+    parser.add_argument("--workers", default="1,2,4", help="Comma-separated worker counts")
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help="Concurrent clients (default: 2 x threads x workers, saturating the server)")
+    parser.add_argument("--threads", type=int, default=int(os.getenv("ASGI_THREADS", "16")),
+                        help="ASGI_THREADS per worker")
+    parser.add_argument("--qdrant-url", default=os.getenv("QDRANT_URL", ":memory:"),
+                        help="Qdrant shared by all workers; ':memory:' gives each worker a private store")
+    parser.add_argument("--chapters", type=int, default=20, help="Chapters in the uploaded synthetic book")
+    parser.add_argument("--duration", type=float, default=20.0, help="Measured seconds per worker count")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Unmeasured seconds before each run")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--generate-latency", default="lognormal:-3:0.5", help="Fake Gemini generate latency spec")
+    parser.add_argument("--embed-latency", default="fixed:0.02", help="Fake Gemini embed latency spec")
+    parser.add_argument("--output", help="Write JSON results to this path")
+    args = parser.parse_args(argv)
+
+    shared_qdrant = args.qdrant_url != ":memory:"
+    if not shared_qdrant:
+        print("warning: QDRANT_URL=:memory: gives each worker a private, mostly empty store; "
+              "pass --qdrant-url to share a Qdrant server", file=sys.stderr)
+    pdf_bytes, pages = harness.synthetic_pdf(harness.synthetic_book(args.chapters))
+
+    results = {}
+    for workers in [int(w) for w in args.workers.split(",")]:
+        results[f"workers_{workers}"] = run_scenario(workers, args, pdf_bytes)
+        print(f"workers={workers}: {json.dumps(results[f'workers_{workers}'])}", file=sys.stderr)
+
+    baseline = next(iter(results.values()))["requests_per_s"] or 1.0
+    for result in results.values():
+        result["speedup"] = round(result["requests_per_s"] / baseline, 3)
+
+    report = {
+        "meta": {
+            "cpu_count": os.cpu_count(),
+            "threads_per_worker": args.threads,
+            "concurrency": args.concurrency or "2 x threads x workers",
+            "shared_qdrant": shared_qdrant,
+            "book_pages": pages,
+            "duration": args.duration,
+            "generate_latency": args.generate_latency,
+            "embed_latency": args.embed_latency,
+        },
+        "results": results,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,294 @@
+"""
+End-to-end and micro benchmarks for ingest and chat-turn latency.
+
+Runs entirely against local stand-ins (FakeProvider for Gemini, in-memory Qdrant)
+so the numbers measure our own overhead plus the simulated external latency.
+
+Usage:
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --quick --compare baseline.json --max-regression 0.2
+"""
+import argparse
+import asyncio
+import datetime
+import io
+import json
+import platform
+import subprocess
+import sys
+import time
+
+sys.path.append('.')
+from benchmarks import harness
+from services.llm import set_provider
+
+
+def bench_ingest(chapter_counts: list[int], iterations: int) -> dict:
+    """PDF-to-indexed throughput for handle_pdf_upload."""
+    results = {}
+    for chapters in chapter_counts:
+        text = harness.synthetic_book(chapters)
+        pdf_bytes, pages = harness.synthetic_pdf(text)
+        samples = []
+        for _ in range(iterations):
+            with harness.quiet(), harness.fresh_app() as app:
+                ingest = app.get_components()['ingest']
+                start = time.perf_counter()
+                asyncio.run(app.handle_pdf_upload(io.BytesIO(pdf_bytes)))
+                samples.append(time.perf_counter() - start)
+                # Chunks of the PDF-extracted text that was actually ingested
+                chunk_count = len(ingest.begin(pdf_bytes)["chunks"])
+        best = min(samples)
+        results[f"chapters_{chapters}"] = {
+            "pages": pages,
+            "chunks": chunk_count,
+            "pages_per_s": round(pages / best, 3),
+            "chunks_per_s": round(chunk_count / best, 3),
+            "latency": harness.summarize(samples),
+        }
+    return results
+
+
+def bench_reingest(chapters: int) -> dict:
+    """Re-upload cost for an identical and a slightly edited book after a full ingest."""
+    from services import telemetry
+
+    text = harness.synthetic_book(chapters)
+    edited = text.replace("Chapter 2\n\n", "Chapter 2\n\nA new opening line about the lantern maker.\n\n", 1)
+    original_pdf, _ = harness.synthetic_pdf(text)
+    edited_pdf, _ = harness.synthetic_pdf(edited)
+    results = {}
+    with harness.fresh_app() as app:
+        for name, pdf_bytes in (("initial", original_pdf), ("identical", original_pdf), ("edited", edited_pdf)):
+            misses = telemetry.CACHE_REQUESTS.value(cache="ingest_chunks", result="miss")
+            with harness.quiet():
+                start = time.perf_counter()
+                asyncio.run(app.handle_pdf_upload(io.BytesIO(pdf_bytes)))
+                elapsed = time.perf_counter() - start
+            results[name] = {
+                "seconds": round(elapsed, 4),
+                "chunks_embedded": int(telemetry.CACHE_REQUESTS.value(cache="ingest_chunks", result="miss") - misses),
+            }
+    return results
+
+
+def bench_chat(turns: int, chapters: int) -> dict:
+    """Per-stage latency percentiles for a /chat turn."""
+    text = harness.synthetic_book(chapters)
+    pdf_bytes, _ = harness.synthetic_pdf(text)
+    with harness.fresh_app() as app:
+        with harness.quiet():
+            asyncio.run(app.handle_pdf_upload(io.BytesIO(pdf_bytes)))
+        app.save_characters([dict(c) for c in harness.CHARACTERS])
+
+        # Stage timings come from the Server-Timing header. Stages nest (e.g. embedding
+        # happens inside retrieval), so they do not sum to the total.
+        timer = harness.StageTimer()
+        client = app.app.test_client()
+        names = [c["name"] for c in harness.CHARACTERS]
+        for turn in range(turns):
+            message = f"{names[turn % len(names)]}, what happened at the river bridge in winter {1900 + turn}?"
+            with harness.quiet():
+                response = client.post('/chat', data={'message': message}, headers={'X-Debug-Timing': '1'})
+            if response.status_code != 200:
+                raise RuntimeError(f"/chat returned {response.status_code}: {response.data[:200]}")
+            timer.record_server_timing(response.headers.get('Server-Timing', ''))
+    return timer.summary()
+
+
+def bench_process_book(chapter_counts: list[int], iterations: int) -> dict:
+    from modules.book_processor import BookProcessor
+
+    processor = BookProcessor()
+    results = {}
+    for chapters in chapter_counts:
+        text = harness.synthetic_book(chapters)
+        samples = []
+        for _ in range(iterations):
+            with harness.quiet():
+                start = time.perf_counter()
+                chunks = processor.process_book(text)
+                samples.append(time.perf_counter() - start)
+        results[f"chapters_{chapters}"] = {
+            "chars": len(text),
+            "chunks": len(chunks),
+            "chars_per_s": round(len(text) / min(samples), 3),
+            "latency": harness.summarize(samples),
+        }
+    return results
+
+
+def bench_store_chunks(corpus_sizes: list[int]) -> dict:
+    from modules.book_processor import BookProcessor
+    from services.embeddings import GeminiEmbedder
+    from services.qdrant import QdrantManager
+
+    with harness.quiet():
+        chunks = BookProcessor().process_book(harness.synthetic_book(max(corpus_sizes) // 4 + 1))
+    results = {}
+    for size in corpus_sizes:
+        batch = chunks[:size]
+        with harness.quiet():
+            qdrant = QdrantManager()
+            GeminiEmbedder.clear_cache()
+            start = time.perf_counter()
+            qdrant.store_chunks(batch)
+            elapsed = time.perf_counter() - start
+        results[f"chunks_{len(batch)}"] = {
+            "seconds": round(elapsed, 4),
+            "chunks_per_s": round(len(batch) / elapsed, 3),
+        }
+    return results
+
+
+def bench_retrieve_memory(corpus_sizes: list[int], queries: int, top_chapters: int = 3) -> dict:
+    """
+    Flat search over all book chunks versus two-stage search (chapters, then their chunks)
+    and search scoped to one character's passages.
+    """
+    from qdrant_client.models import PointStruct
+    from modules.book_processor import BookProcessor
+    from modules.ingest import chapter_point_id, mention_pattern
+    from services.embeddings import GeminiEmbedder
+    from services.qdrant import QdrantManager
+    from services.llm import get_provider
+
+    provider = get_provider()
+    processor = BookProcessor()
+    patterns = {c["name"]: mention_pattern(c) for c in harness.CHARACTERS}
+    character = harness.CHARACTERS[0]["name"]
+    results = {}
+    for size in corpus_sizes:
+        text = harness.synthetic_book(size // 40 + 1, paragraphs_per_chapter=40)
+        with harness.quiet():
+            chapters = processor.detect_chapters(text)
+            paragraphs = [
+                (p, chapter["chapter_id"])
+                for chapter in chapters
+                for p in text[chapter["start"]:chapter["end"]].split("\n\n")
+                if p.strip() and not p.startswith("Chapter ")
+            ]
+            qdrant = QdrantManager()
+            points = [
+                PointStruct(id=i, vector=provider.embed(paragraphs[i % len(paragraphs)][0]),
+                            payload={"text": paragraphs[i % len(paragraphs)][0],
+                                     "chapter_id": paragraphs[i % len(paragraphs)][1],
+                                     "characters": [name for name, pattern in patterns.items()
+                                                    if pattern.search(paragraphs[i % len(paragraphs)][0])]})
+                for i in range(size)
+            ]
+            qdrant.client.upsert(collection_name="book_chunks", points=points)
+            index = processor.chapter_index(text, chapters)
+            qdrant.upsert_chunks(index, ids=[chapter_point_id(e["metadata"]["chapter_id"]) for e in index],
+                                 collection="chapters")
+        for name, stages, scope in (("", 0, None), ("_two_stage", top_chapters, None), ("_character", 0, character)):
+            GeminiEmbedder.clear_cache()  # every variant embeds the same queries
+            samples = []
+            for q in range(queries):
+                query = " ".join(harness.WORDS[q % len(harness.WORDS):][:6])
+                with harness.quiet():
+                    start = time.perf_counter()
+                    qdrant.retrieve_memory(query=query, similarity_threshold=0.0, top_chapters=stages,
+                                           character=scope)
+                    samples.append(time.perf_counter() - start)
+            results[f"corpus_{size}{name}"] = harness.summarize(samples)
+    return results
+
+
+def _flatten(data: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in data.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(_flatten(value, path))
+        elif isinstance(value, (int, float)):
+            flat[path] = value
+    return flat
+
+
+def compare(baseline: dict, current: dict, max_regression: float) -> list[str]:
+    """Return human-readable regressions beyond `max_regression` (a fraction)."""
+    old, new = _flatten(baseline["results"]), _flatten(current["results"])
+    regressions = []
+    for path, new_value in sorted(new.items()):
+        old_value = old.get(path)
+        if not old_value:
+            continue
+        if path.endswith(("p50_ms", "p95_ms", "p99_ms")):
+            change = (new_value - old_value) / old_value
+        elif path.endswith("_per_s"):
+            change = (old_value - new_value) / old_value
+        else:
+            continue
+        if change > max_regression:
+            regressions.append(f"{path}: {old_value} -> {new_value} ({change:+.1%} worse)")
+    return regressions
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Ingest and chat-turn benchmarks")
+    parser.add_argument("--suite", choices=["all", "ingest", "chat", "micro"], default="all")
+    parser.add_argument("--quick", action="store_true", help="Smaller corpora and fewer iterations")
+    parser.add_argument("--generate-latency", default="0", help="Fake Gemini generate latency spec")
+    parser.add_argument("--embed-latency", default="0", help="Fake Gemini embed latency spec")
+    parser.add_argument("--output", help="Write JSON results to this path")
+    parser.add_argument("--compare", help="Baseline JSON results to check for regressions")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="Allowed slowdown as a fraction before failing (default 0.2)")
+    args = parser.parse_args(argv)
+
+    set_provider(harness.make_provider(args.generate_latency, args.embed_latency))
+    if args.quick:
+        ingest_sizes, chat_turns, iterations = [2, 8], 20, 2
+        book_sizes, store_sizes, retrieve_sizes, queries = [10, 50], [20, 80], [100, 1000], 20
+    else:
+        ingest_sizes, chat_turns, iterations = [5, 20, 60], 100, 3
+        book_sizes, store_sizes, retrieve_sizes, queries = [10, 50, 200], [50, 200, 500], [100, 1000, 5000], 50
+
+    results = {}
+    if args.suite in ("all", "ingest"):
+        results["ingest"] = bench_ingest(ingest_sizes, iterations)
+        results["reingest"] = bench_reingest(ingest_sizes[-1])
+    if args.suite in ("all", "chat"):
+        results["chat_turn"] = bench_chat(chat_turns, chapters=ingest_sizes[0])
+    if args.suite in ("all", "micro"):
+        results["process_book"] = bench_process_book(book_sizes, iterations)
+        results["store_chunks"] = bench_store_chunks(store_sizes)
+        results["retrieve_memory"] = bench_retrieve_memory(retrieve_sizes, queries)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "generate_latency": args.generate_latency,
+            "embed_latency": args.embed_latency,
+            "quick": args.quick,
+        },
+        "results": results,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.max_regression)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,11 +7,41 @@ class Config:
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
     QDRANT_URL = os.getenv("QDRANT_URL")
 
+    # "gemini" (live), "fake" (deterministic offline), "record" or "replay" (cassette)
+    LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")
+    LLM_CASSETTE = os.getenv("LLM_CASSETTE", "llm_cassette.jsonl")
+    # Latency specs for the fake provider, e.g. "fixed:0.05" or "lognormal:-1.5:0.4"
+    FAKE_GENERATE_LATENCY = os.getenv("FAKE_GENERATE_LATENCY", "0")
+    FAKE_EMBED_LATENCY = os.getenv("FAKE_EMBED_LATENCY", "0")
+    # Optional JSON file of [regex, reply] pairs for the fake provider's canned replies
+    FAKE_RULES = os.getenv("FAKE_RULES", "")
+
+    EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+    # Always send a Server-Timing header; clients can also opt in per request with X-Debug-Timing: 1
+    TIMING_HEADER = os.getenv("TIMING_HEADER", "false").lower() in ("1", "true", "yes")
+
+    # Shared state for multi-worker deployments: "memory://", "sqlite:///state.db" or "redis://host:6379/0"
+    STATE_STORE_URL = os.getenv("STATE_STORE_URL", "memory://")
+    DEBUG = os.getenv("FLASK_DEBUG", "false").lower() in ("1", "true", "yes")
+    # Request threads per ASGI worker process (see asgi.py)
+    ASGI_THREADS = int(os.getenv("ASGI_THREADS", "16"))
+    # Directory where each worker writes its metrics, so /metrics and /ready cover all workers
+    METRICS_DIR = os.getenv("METRICS_DIR", "")
+    METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+
+    # Local checkpoint manifests for resumable book ingest
+    INGEST_DIR = os.getenv("INGEST_DIR", ".ingest")
+    INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "32"))
+    # Two-stage retrieval: search chunks only within this many best-matching chapters (0 disables)
+    RETRIEVAL_TOP_CHAPTERS = int(os.getenv("RETRIEVAL_TOP_CHAPTERS", "3"))
+    # Character turns search only passages mentioning the character once at least this many are indexed
+    CHARACTER_MIN_PASSAGES = int(os.getenv("CHARACTER_MIN_PASSAGES", "3"))
+
     @classmethod
     def validate(cls):
-        required = ["GEMINI_API_KEY", "QDRANT_URL"]
+        required = ["QDRANT_URL"]
+        if cls.LLM_PROVIDER.lower() in ("gemini", "record"):
+            required.append("GEMINI_API_KEY")
         for var in required:
             if not getattr(cls, var):
-                raise ValueError(f"Missing required environment variable: {var}")
-
-Config.validate()
\ No newline at end of file
+                raise ValueError(f"Missing required environment variable: {var}")
\ No newline at end of file
@@ -1,28 +1,160 @@
+import hashlib
 import logging
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import re
+from services import telemetry
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+UNITS = "one|two|three|four|five|six|seven|eight|nine"
+TEENS = "ten|eleven|twelve|thirteen|fourteen|fifteen|sixteen|seventeen|eighteen|nineteen"
+TENS = "twenty|thirty|forty|fifty|sixty|seventy|eighty|ninety"
+# Upper-case only, so words like "mix" or "did" are not read as numerals
+ROMAN = r"(?-i:(?=[MDCLXVI])M{0,4}(?:CM|CD|D?C{0,3})(?:XC|XL|L?X{0,3})(?:IX|IV|V?I{0,3}))"
+NUMBER = rf"(?:\d+|{ROMAN}|(?:{TENS})(?:[- ](?:{UNITS}))?|{TEENS}|{UNITS})"
+# A whole heading line: "Chapter 12", "CHAPTER XII", "Part Two: The Crossing", "Epilogue".
+# Not prose such as "Book I had lent her..." or "Chapter Two ended badly, he said."
+HEADING_PATTERN = re.compile(
+    rf"^[ \t]*(?P<kind>chapter|part|book|section|prologue|epilogue)(?:[ \t]+(?P<number>{NUMBER}))?"
+    r"(?:[ \t]*[:.\-–—][ \t]*(?P<title>[^\n]*?))?[ \t]*$",
+    re.IGNORECASE | re.MULTILINE
+)
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+SENTENCE_ENDINGS = (".", "!", "?", '"', "'", "\u201d", "\u2019")
+SUMMARY_CHARS = 800
+
 class BookProcessor:
     def __init__(self):
         logging.info("Initializing BookProcessor with RecursiveCharacterTextSplitter")
+        from langchain.text_splitter import RecursiveCharacterTextSplitter  # deferred: heavy import
         self.splitter = RecursiveCharacterTextSplitter(
             chunk_size=1000,
             chunk_overlap=200,
-            separators=["\n\nChapter ", "\n\nSection ", "\n\n", "\n", ".", " "]
+            separators=["\n\nChapter ", "\n\nSection ", "\n\n", "\n", ".", " "],
+            add_start_index=True
+        )
+
+    @staticmethod
+    def _is_heading(text: str, match: re.Match) -> bool:
+        """
+        A standalone heading: numbered (prologue/epilogue excepted), short, not a sentence, and at
+        the start of the text, after a blank line or page break ("\\f" from extract_pdf_text), or
+        mid-page right after the end of a paragraph.
+        """
+        line = match.group(0).strip()
+        numbered = match.group("number") is not None
+        if numbered == (match.group("kind").lower() in ("prologue", "epilogue")):
+            return False
+        if len(line) > 80 or line.endswith((",", ";")):
+            return False
+        # "Chapter 1." and "CHAPTER I." are headings; a titled line ending in "." is a sentence
+        if line.endswith(".") and match.group("title"):
+            return False
+        before = text[:match.start()]
+        if not before.strip():
+            return True
+        previous_line = before[:-1].rsplit("\n", 1)[-1].strip()
+        if not previous_line:
+            return True
+        # PDF extraction drops blank lines, so a chapter opening mid-page follows the previous
+        # paragraph directly: accept a numbered, capitalized heading after a finished sentence
+        # or another heading ("PART ONE" / "Chapter 1"), but not after a wrapped prose line
+        return (
+            numbered
+            and match.group("kind")[0].isupper()
+            and (previous_line.endswith(SENTENCE_ENDINGS) or HEADING_PATTERN.fullmatch(previous_line) is not None)
         )
-    
-    def process_book(self, text: str) -> list[dict]:
+
+    def detect_chapters(self, text: str) -> list[dict]:
+        """
+        Structural pre-pass: find chapter and section headings.
+        Returns chapters as {"chapter_id", "index", "title", "start", "end", "sections"} with
+        character offsets into `text`; sections are {"title", "start"}. Text before the first
+        heading becomes a "Front matter" chapter, and a book without headings is one chapter.
+        """
+        chapter_starts, sections = [], []
+        for match in HEADING_PATTERN.finditer(text):
+            if not self._is_heading(text, match):
+                continue
+            heading = {"title": match.group(0).strip(), "start": match.start()}
+            (sections if match.group("kind").lower() == "section" else chapter_starts).append(heading)
+
+        if not chapter_starts or text[:chapter_starts[0]["start"]].strip():
+            title = "Front matter" if chapter_starts else "Full text"
+            chapter_starts.insert(0, {"title": title, "start": 0})
+
+        chapters = []
+        for index, heading in enumerate(chapter_starts):
+            end = chapter_starts[index + 1]["start"] if index + 1 < len(chapter_starts) else len(text)
+            chapters.append({
+                # Content-derived, so editing one chapter leaves the other chapters' ids unchanged;
+                # whitespace is normalized because PDF page breaks shift when earlier pages change
+                "chapter_id": hashlib.sha256(" ".join(text[heading["start"]:end].split()).encode("utf-8")).hexdigest()[:16],
+                "index": index,
+                "title": heading["title"],
+                "start": heading["start"],
+                "end": end,
+                "sections": [s for s in sections if heading["start"] <= s["start"] < end],
+            })
+        logging.info(f"Detected {len(chapters)} chapters and {len(sections)} sections")
+        return chapters
+
+    def process_book(self, text: str, chapters: list[dict] = None) -> list[dict]:
+        """
+        Split each chapter separately so no chunk spans two chapters.
+        Chunk metadata carries chapter_id, chapter_title, section (if any) and start offset.
+        """
         logging.info("Processing book text...")
-        
+
         if not isinstance(text, str) or not text.strip():
             logging.error("Invalid input: Book text must be a non-empty string")
             raise ValueError("Book text must be a non-empty string")
-        
+
         logging.info("Splitting text into chunks")
-        chunks = self.splitter.split_text(text)
-        
+        with telemetry.span("chunking"):
+            chapters = chapters or self.detect_chapters(text)
+            chunks = []
+            for chapter in chapters:
+                chapter_text = text[chapter["start"]:chapter["end"]]
+                if not chapter_text.strip():
+                    continue
+                for doc in self.splitter.create_documents([chapter_text]):
+                    start = chapter["start"] + doc.metadata["start_index"]
+                    metadata = {
+                        "chapter_id": chapter["chapter_id"],
+                        "chapter_title": chapter["title"],
+                        "start": start,
+                    }
+                    section = next((s["title"] for s in reversed(chapter["sections"]) if s["start"] <= start), None)
+                    if section:
+                        metadata["section"] = section
+                    chunks.append({"text": doc.page_content, "metadata": metadata})
+
         logging.info(f"Successfully split text into {len(chunks)} chunks")
-        print(chunks)
-        return [{"text": chunk, "metadata": {}} for chunk in chunks]  # Metadata placeholder
+        return chunks
+
+    def chapter_index(self, text: str, chapters: list[dict] = None) -> list[dict]:
+        """
+        One entry per chapter with an extractive summary (title plus sentences sampled evenly
+        across the chapter) whose embedding serves as the chapter's summary vector.
+        """
+        index = []
+        for chapter in chapters or self.detect_chapters(text):
+            body = text[chapter["start"]:chapter["end"]].strip()
+            if body.startswith(chapter["title"]):
+                body = body[len(chapter["title"]):].strip()
+            if not body:
+                continue
+            sentences = [s for s in SENTENCE_END.split(body.replace("\n", " ")) if s.strip()]
+            picked, length = [], 0
+            step = max(1, len(sentences) // 8)
+            for sentence in sentences[::step]:
+                if length + len(sentence) > SUMMARY_CHARS and picked:
+                    break
+                picked.append(sentence)
+                length += len(sentence) + 1
+            index.append({
+                "text": f"{chapter['title']}\n{' '.join(picked)[:SUMMARY_CHARS]}",
+                "metadata": {k: chapter[k] for k in ("chapter_id", "index", "title", "start", "end")},
+            })
+        return index
@@ -1,13 +1,10 @@
+import sys
+sys.path.append('.')
 import json
 import logging
 from pydantic import BaseModel
-import google.generativeai as genai
-import os
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+from services.llm import get_provider
+from services import telemetry
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -16,6 +13,7 @@ class CharacterSchema(BaseModel):
     name: str
     traits: dict[str, float] # "arousal" and "valence" values
     summary: str
+    aliases: list[str] = []  # other proper names, nicknames and titled names used for the character in the text
 
 class CharacterExtractor:
     def extract(self, text: str) -> list[CharacterSchema]:
@@ -33,6 +31,7 @@ class CharacterExtractor:
           - "arousal": float (0 to 1, emotional intensity)
           - "valence": float (0 to 1, emotional positivity, 0=negative, 1=positive)
         - "summary": string, brief and direct yet detailed character description (max 100 words)
+        - "aliases": array of strings, other proper names the text uses for the character, such as a surname, nickname or titled name (may be empty); never roles or descriptions like "the soldier"
         
         Rules:
         - Base traits on text evidence only
@@ -41,15 +40,15 @@ class CharacterExtractor:
         
         Example output:
         [
-            {{"name": "John", "traits": {{"arousal": 0.8, "valence": 0.2}}, "summary": "An angry soldier seeking revenge"}},
-            {{"name": "Mary", "traits": {{"arousal": 0.3, "valence": 0.7}}, "summary": "A calm healer helping others"}}
+            {{"name": "John", "traits": {{"arousal": 0.8, "valence": 0.2}}, "summary": "An angry soldier seeking revenge", "aliases": ["Johnny", "Captain Reed"]}},
+            {{"name": "Mary", "traits": {{"arousal": 0.3, "valence": 0.7}}, "summary": "A calm healer helping others", "aliases": []}}
         ]
         """
-        model = genai.GenerativeModel('gemini-1.5-pro')
-        response = model.generate_content(prompt)
-        logging.info(f"...Successfully generated character data in type {type(response.text)}...")
+        with telemetry.span("character_extraction"):
+            response_text = get_provider().generate(prompt, model='gemini-1.5-pro')
+        logging.info(f"...Successfully generated character data in type {type(response_text)}...")
 
-        return  response.text if isinstance(response.text[0], CharacterSchema) else  self._parse_response(response.text)
+        return self._parse_response(response_text)
     
     def _parse_response(self, raw: str) -> list[CharacterSchema]:
         try:
@@ -72,7 +71,8 @@ class CharacterExtractor:
                 characters.append(CharacterSchema(
                     name=item["name"],
                     traits=normalized_traits,
-                    summary=item.get("summary", "")
+                    summary=item.get("summary", ""),
+                    aliases=[a.strip() for a in item.get("aliases") or [] if isinstance(a, str) and a.strip()]
                 ))
             
             logging.info(f"Successfully parsed {len(characters)} characters")
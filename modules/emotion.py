@@ -1,16 +1,14 @@
 from sys import path
 path.append('.')
-import google.generativeai as genai
 import json
 import logging
-from config import Config
+from services.llm import get_provider
+from services import telemetry
 import re
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-genai.configure(api_key=Config.GEMINI_API_KEY)
-
 class PsiEmotionEngine:
     def __init__(self, base_params: dict):
         logging.info("Initializing PsiEmotionEngine with base parameters")
@@ -70,9 +68,9 @@ class PsiEmotionEngine:
 
         
         try:
-            model = genai.GenerativeModel('gemini-2.0-flash')
-            response = model.generate_content(prompt)
-            response= self._clean_json_response(response.text)
+            with telemetry.span("sentiment"):
+                response = get_provider().generate(prompt, model='gemini-2.0-flash')
+            response= self._clean_json_response(response)
             sentiment_data = json.loads(response.strip())
             polarity = float(sentiment_data.get("polarity", 0.0))
             intensity = float(sentiment_data.get("intensity", 0.5))
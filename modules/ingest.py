@@ -0,0 +1,368 @@
+import sys
+sys.path.append('.')
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import uuid
+from datetime import datetime
+from config import Config
+from services import telemetry
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends of a few short lines are effectively atomic anyway
+    fcntl = None
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+MIN_NAME_CHARS = 3
+LEADING_STOPWORDS = {"the", "a", "an", "his", "her", "their", "my", "our", "your", "its", "that", "this"}
+GENERIC_NAMES = {
+    "he", "she", "him", "they", "them", "you", "i", "me", "we", "it", "one",
+    "mr", "mrs", "ms", "miss", "sir", "madam", "lord", "lady", "king", "queen", "prince", "princess",
+    "captain", "doctor", "dr", "master", "mistress", "father", "mother", "brother", "sister",
+    "uncle", "aunt", "son", "daughter", "boy", "girl", "man", "woman", "old", "young",
+    "narrator", "stranger", "soldier", "guard", "child",
+}
+
+
+def content_hash(data) -> str:
+    """SHA-256 hex digest of bytes or text."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def chunk_point_id(chunk_hash: str) -> str:
+    """Deterministic Qdrant point id for a chunk, so re-upserting the same chunk is a no-op."""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"chunk:{chunk_hash}"))
+
+
+def chunk_hash(chunk: dict) -> str:
+    """
+    Content hash identifying a stored chunk. The chapter id is part of it, so a chunk's stored
+    chapter tag is always current; whitespace is normalized so shifted PDF line and page breaks
+    don't count as edits.
+    """
+    return content_hash(f"{chunk['metadata'].get('chapter_id', '')}\n{' '.join(chunk['text'].split())}")
+
+
+def usable_name(name: str) -> bool:
+    """
+    Whether a name or alias identifies one character: at least MIN_NAME_CHARS long, capitalized,
+    and not a role, title, kinship word or pronoun ("the soldier", "Mother", "he") that would
+    tag every passage mentioning it.
+    """
+    words = name.split()
+    if len(name.strip()) < MIN_NAME_CHARS or not any(c.isupper() for c in name):
+        return False
+    if words[0].lower() in LEADING_STOPWORDS:
+        return False
+    return not all(word.lower().strip(".") in GENERIC_NAMES for word in words)
+
+
+def mention_pattern(character: dict) -> re.Pattern | None:
+    """
+    Pattern matching a character's name or any usable alias as whole words, or None when the
+    character has no usable name. Names are proper nouns, so matching is case-sensitive ("Hope"
+    does not match "hope"); the all-caps form is an extra alternative for headings and shouting.
+    """
+    names = {name.strip() for name in (character["name"], *character.get("aliases", [])) if usable_name(name)}
+    if not names:
+        return None
+    names |= {name.upper() for name in names}
+    # Names may be broken across lines in extracted PDF text
+    alternatives = sorted(
+        (r"\s+".join(re.escape(part) for part in name.split()) for name in names),
+        key=len, reverse=True
+    )
+    return re.compile(r"(?<!\w)(?:" + "|".join(alternatives) + r")(?!\w)")
+
+
+def chapter_point_id(chapter_id: str) -> str:
+    """Deterministic Qdrant point id for a chapter index entry."""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"chapter:{chapter_id}"))
+
+
+class IngestManager:
+    """
+    Resumable, idempotent book ingest keyed by PDF content hash.
+
+    Progress is checkpointed in a directory per Qdrant location and collection
+    (<manifest_dir>/<hash of location and collection>/), so a manifest never describes another store:
+      - <pdf_hash>.json: job status, chunk hashes, stored-chunk count, chapter index,
+        extracted characters and the per-character chunk index
+      - <pdf_hash>.txt: extracted book text, so a resumed job skips PDF parsing
+      - stored.log: append-only log of every stored chunk hash (and "chapter:<id>" for every
+        chapter summary), shared by all books and worker processes, so a re-uploaded or slightly
+        edited book only embeds new or changed chunks
+    Nothing is written to disk for an in-memory Qdrant, whose points die with the process.
+    Work the log or a "complete" manifest says is done is checked against Qdrant before it is
+    skipped, so a dropped or recreated collection is re-ingested rather than silently lost.
+    """
+
+    def __init__(self, qdrant, book_processor, character_extractor, manifest_dir: str = None,
+                 batch_size: int = None, collection: str = "book_chunks"):
+        self.qdrant = qdrant
+        self.book_processor = book_processor
+        self.character_extractor = character_extractor
+        self.batch_size = batch_size or Config.INGEST_BATCH_SIZE
+        self.collection = collection
+        self.location = getattr(qdrant, "location", Config.QDRANT_URL)
+        self.persistent = self.location != ":memory:"
+        store_key = content_hash(f"{self.location}\n{collection}")[:16]
+        self.manifest_dir = os.path.join(manifest_dir or Config.INGEST_DIR, store_key)
+        self._lock = threading.RLock()
+        self._manifests = {}  # in-memory Qdrant only
+        self._texts = {}
+        self._stored = set()
+        self._log_offset = 0
+        if self.persistent:
+            os.makedirs(self.manifest_dir, exist_ok=True)
+            self._refresh_stored()
+        logging.info("IngestManager initialized with manifest_dir=%s (%s), %d stored chunks",
+                     self.manifest_dir, "persistent" if self.persistent else "in-memory", len(self._stored))
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.manifest_dir, name)
+
+    def _read_json(self, name: str, default):
+        if not self.persistent:
+            return self._manifests.get(name, default)
+        try:
+            with open(self._path(name), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return default
+
+    def _write_json(self, name: str, data) -> None:
+        if not self.persistent:
+            self._manifests[name] = data
+            return
+        tmp_path = self._path(f"{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self._path(name))
+
+    def _checkpoint(self, manifest: dict) -> None:
+        with self._lock:
+            manifest["updated_at"] = datetime.now().isoformat(timespec="seconds")
+            self._write_json(f"{manifest['pdf_hash']}.json", manifest)
+
+    def _refresh_stored(self) -> None:
+        """Pick up log entries appended since the last read, including other processes' entries."""
+        if not self.persistent:
+            return
+        with self._lock:
+            try:
+                with open(self._path("stored.log"), "r", encoding="utf-8") as f:
+                    f.seek(self._log_offset)
+                    data = f.read()
+            except FileNotFoundError:
+                return
+            complete = data[:data.rfind("\n") + 1]  # leave a partially written line for next time
+            self._stored.update(line for line in complete.splitlines() if line)
+            self._log_offset += len(complete.encode("utf-8"))
+
+    def _mark_stored(self, keys: list[str]) -> None:
+        with self._lock:
+            self._stored.update(keys)
+            if not self.persistent or not keys:
+                return
+            with open(self._path("stored.log"), "a", encoding="utf-8") as f:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.write("".join(f"{key}\n" for key in keys))
+                    f.flush()
+                finally:
+                    if fcntl:
+                        fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _already_stored(self, point_ids: dict, collection: str) -> set:
+        """
+        Keys of `point_ids` ({key: point id}) that the log marks as stored and whose
+        points really exist in `collection`.
+        """
+        self._refresh_stored()
+        with self._lock:
+            logged = {key: point_id for key, point_id in point_ids.items() if key in self._stored}
+        if not logged:
+            return set()
+        existing = self.qdrant.existing_ids(list(logged.values()), collection)
+        missing = len(logged) - len(existing)
+        if missing:
+            logging.warning(f"{missing} points logged as stored are missing from collection {collection}; re-storing")
+        return {key for key, point_id in logged.items() if point_id in existing}
+
+    def begin(self, pdf_bytes: bytes) -> dict:
+        """Load the manifest for this PDF, or start a new job."""
+        pdf_hash = content_hash(pdf_bytes)
+        manifest = self._read_json(f"{pdf_hash}.json", None)
+        if manifest and manifest["status"] == "complete" and not self._points_present(manifest):
+            logging.warning(f"Ingest {pdf_hash[:12]} is complete but its points are missing; re-ingesting")
+            manifest.update(status="in_progress", stored_chunks=0, character_index=None)
+            self._checkpoint(manifest)
+        if manifest:
+            logging.info(f"Resuming ingest {pdf_hash[:12]} (status: {manifest['status']}, "
+                         f"{manifest['stored_chunks']}/{len(manifest['chunks'])} chunks stored)")
+            return manifest
+        manifest = {
+            "pdf_hash": pdf_hash,
+            "status": "in_progress",
+            "chunks": [],
+            "stored_chunks": 0,
+            "chapters": None,
+            "characters": None,
+            "character_index": None,
+        }
+        self._checkpoint(manifest)
+        return manifest
+
+    def _points_present(self, manifest: dict) -> bool:
+        chunk_ids = sorted({chunk_point_id(h) for h in manifest["chunks"]})
+        chapter_ids = [chapter_point_id(c["chapter_id"]) for c in manifest.get("chapters") or []]
+        return (len(self.qdrant.existing_ids(chunk_ids, self.collection)) == len(chunk_ids)
+                and len(self.qdrant.existing_ids(chapter_ids, "chapters")) == len(chapter_ids))
+
+    def load_text(self, manifest: dict, pdf_bytes: bytes, extract_text) -> str:
+        """Return the book text, extracting it with `extract_text(pdf_bytes)` only once per PDF."""
+        text_name = f"{manifest['pdf_hash']}.txt"
+        if text_name in self._texts:
+            return self._texts[text_name]
+        if self.persistent and os.path.exists(self._path(text_name)):
+            with open(self._path(text_name), "r", encoding="utf-8") as f:
+                return f.read()
+        text = extract_text(pdf_bytes)
+        if not text.strip():
+            return text
+        if self.persistent:
+            tmp_path = self._path(f"{text_name}.{os.getpid()}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp_path, self._path(text_name))
+        else:
+            self._texts[text_name] = text
+        return text
+
+    def split(self, text: str) -> tuple[list[dict], list[dict]]:
+        """
+        Detect chapters and chunk the book once for all index steps. Returns (chapters, chunks);
+        each chunk carries its content hash under "hash".
+        """
+        chapters = self.book_processor.detect_chapters(text)
+        chunks = self.book_processor.process_book(text, chapters)
+        for chunk in chunks:
+            chunk["hash"] = chunk_hash(chunk)
+        return chapters, chunks
+
+    def index_chunks(self, manifest: dict, chunks: list[dict]) -> int:
+        """
+        Store the chunks from split() not already in Qdrant, in checkpointed batches.
+        Returns the number of chunks embedded and stored by this call.
+        """
+        done = self._already_stored({chunk["hash"]: chunk_point_id(chunk["hash"]) for chunk in chunks},
+                                    self.collection)
+        pending = [chunk for chunk in chunks if chunk["hash"] not in done]
+        with self._lock:
+            manifest["chunks"] = [chunk["hash"] for chunk in chunks]
+            manifest["stored_chunks"] = len(chunks) - len(pending)
+            if pending:
+                manifest["character_index"] = None  # re-stored points lose their character tags
+        self._checkpoint(manifest)
+        logging.info(f"Ingest {manifest['pdf_hash'][:12]}: {len(chunks)} chunks, "
+                     f"{len(chunks) - len(pending)} already stored, {len(pending)} to store")
+
+        # Identical chunks within the book share a hash; store each once
+        unique = list({chunk["hash"]: chunk for chunk in pending}.values())
+        for start in range(0, len(unique), self.batch_size):
+            batch = unique[start:start + self.batch_size]
+            self.qdrant.upsert_chunks(
+                [{"text": chunk["text"], "metadata": chunk.get("metadata", {})} for chunk in batch],
+                ids=[chunk_point_id(chunk["hash"]) for chunk in batch],
+                collection=self.collection
+            )
+            self._mark_stored([chunk["hash"] for chunk in batch])
+            with self._lock:
+                done.update(chunk["hash"] for chunk in batch)
+                manifest["stored_chunks"] = sum(1 for h in manifest["chunks"] if h in done)
+            self._checkpoint(manifest)
+        telemetry.CACHE_REQUESTS.inc(len(chunks) - len(pending), cache="ingest_chunks", result="hit")
+        telemetry.CACHE_REQUESTS.inc(len(pending), cache="ingest_chunks", result="miss")
+        return len(unique)
+
+    def index_chapters(self, manifest: dict, text: str, chapters: list[dict]) -> list[dict]:
+        """
+        Store the chapter index (title, offsets, summary vector) for the chapters from split()
+        in the "chapters" collection. Chapters already stored by any book are skipped.
+        """
+        entries = self.book_processor.chapter_index(text, chapters)
+        done = self._already_stored(
+            {f"chapter:{e['metadata']['chapter_id']}": chapter_point_id(e["metadata"]["chapter_id"]) for e in entries},
+            "chapters"
+        )
+        pending = [e for e in entries if f"chapter:{e['metadata']['chapter_id']}" not in done]
+        with self._lock:
+            manifest["chapters"] = [entry["metadata"] for entry in entries]
+        if pending:
+            self.qdrant.upsert_chunks(
+                pending,
+                ids=[chapter_point_id(entry["metadata"]["chapter_id"]) for entry in pending],
+                collection="chapters"
+            )
+            self._mark_stored([f"chapter:{entry['metadata']['chapter_id']}" for entry in pending])
+        self._checkpoint(manifest)
+        logging.info(f"Ingest {manifest['pdf_hash'][:12]}: {len(entries)} chapters, {len(pending)} stored")
+        return manifest["chapters"]
+
+    def extract_characters(self, manifest: dict, text: str) -> list[dict]:
+        """Extract characters once per PDF; a resumed job reuses the checkpointed result."""
+        if manifest.get("characters") is not None:
+            return manifest["characters"]
+        characters = [char.model_dump() for char in self.character_extractor.extract(text)]
+        with self._lock:
+            manifest["characters"] = characters
+        self._checkpoint(manifest)
+        return characters
+
+    def index_characters(self, manifest: dict, chunks: list[dict], characters: list[dict]) -> dict:
+        """
+        Tag the stored chunks from split() with the characters they mention by name or alias
+        (a "characters" payload list) and return the inverted index {character name: [chunk
+        point ids]}. Runs after index_chunks; a resumed job reuses the checkpointed index.
+        """
+        if manifest.get("character_index") is not None:
+            return manifest["character_index"]
+        patterns = {}
+        for character in characters:
+            pattern = mention_pattern(character)
+            if pattern is None:
+                logging.warning(f"Character {character['name']!r} has no usable name or alias; not indexing mentions")
+                continue
+            patterns[character["name"]] = pattern
+        index = {name: [] for name in patterns}
+        tags = {}
+        for chunk in chunks:
+            point_id = chunk_point_id(chunk["hash"])
+            names = [name for name, pattern in patterns.items() if pattern.search(chunk["text"])]
+            if names and point_id not in tags:
+                tags[point_id] = names
+                for name in names:
+                    index[name].append(point_id)
+        self.qdrant.tag_chunks(tags, key="characters", collection=self.collection)
+        with self._lock:
+            manifest["character_index"] = index
+        self._checkpoint(manifest)
+        logging.info(f"Ingest {manifest['pdf_hash'][:12]}: tagged {len(tags)} chunks with character mentions "
+                     f"({', '.join(f'{name}: {len(ids)}' for name, ids in index.items())})")
+        return index
+
+    def complete(self, manifest: dict) -> None:
+        with self._lock:
+            manifest["status"] = "complete"
+        self._checkpoint(manifest)
+        logging.info(f"Ingest {manifest['pdf_hash'][:12]} complete")
@@ -1,58 +1,85 @@
 import sys
 sys.path.append('.')
-import google.generativeai as genai
 import logging
 from typing import List
-from langchain.memory import ChatMessageHistory
 from datetime import datetime
 from services.qdrant import QdrantManager
+from services.llm import get_provider
+from services.state import get_state_store, StateStore
+from services import telemetry
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+SHORT_TERM_MESSAGES = 10  # the last 5 interactions
+
 class MemoryManager:
     """Manages short-term and long-term memory for conversation history."""
     
-    def __init__(self, max_summary_length: int = 500, model_name: str = 'gemini-2.0-flash'):
+    def __init__(self, max_summary_length: int = 500, model_name: str = 'gemini-2.0-flash',
+                 long_term: QdrantManager = None, store: StateStore = None):
         """
         Initialize MemoryManager with configurable parameters.
+        Pass `long_term` to share an existing QdrantManager instead of opening a new client.
+        Short-term memory lives in the shared state store as one list per session, appended
+        and trimmed atomically, so every worker sees the same conversation and concurrent turns
+        keep each other's messages.
         """
-        self.memory = ChatMessageHistory()
-        self.long_term = QdrantManager()
+        self.long_term = long_term or QdrantManager()
+        self.store = store or get_state_store()
         self.max_summary_length = max_summary_length
-        self.model = genai.GenerativeModel(model_name)
+        self.model_name = model_name
         logging.info("MemoryManager initialized with max_summary_length=%d, model=%s", 
                     max_summary_length, model_name)
     
-    def add_message(self, user_message: str, bot_response: str) -> None:
+    def history(self, session_id: str = "default"):
+        """Load the short-term memory of a session as a ChatMessageHistory."""
+        from langchain.memory import ChatMessageHistory  # deferred: heavy import
+        memory = ChatMessageHistory()
+        for msg in self.store.get_list(self._history_key(session_id)):
+            if msg["type"] == "human":
+                memory.add_user_message(msg["content"])
+            else:
+                memory.add_ai_message(msg["content"])
+        return memory
+
+    @staticmethod
+    def _history_key(session_id: str) -> str:
+        return f"messages:{session_id}"
+
+    def add_message(self, user_message: str, bot_response: str, session_id: str = "default") -> None:
         """Add a user message and bot response to short-term memory."""
         try:
             logging.info("Storing conversation messages")
-            self.memory.add_user_message(user_message.strip())
-            self.memory.add_ai_message(bot_response.strip())
+            self.store.append_to_list(self._history_key(session_id), [
+                {"type": "human", "content": user_message.strip()},
+                {"type": "ai", "content": bot_response.strip()},
+            ])
         except Exception as e:
             logging.error("Failed to add messages to memory: %s", str(e))
             raise
     
-    def archive_conversation(self, responder) -> bool:
+    def archive_conversation(self, responder, session_id: str = "default") -> bool:
         """
         Archive the current conversation to long-term storage by summarizing core content
         with a single LLM prompt, then clear short-term memory.
         """
         try:
-            if not self.memory.messages:
+            messages = self.history(session_id).messages
+            if not messages:
                 logging.info("No messages to archive")
                 return False
             
             logging.info("Archiving conversation")
-            summary = self._extract_and_summarize_core_content(responder= responder, messages=self.memory.messages)
-            summary={"text":summary}
-            self.long_term.store_chunks([summary], collection="conversations")
+            with telemetry.span("archiving"):
+                summary = self._extract_and_summarize_core_content(responder= responder, messages=messages)
+                summary={"text":summary}
+                self.long_term.store_chunks([summary], collection="conversations")
 
             # Cleaning up short term memory
-            if len(self.memory.messages) > 10:
+            if len(messages) > SHORT_TERM_MESSAGES:
                 logging.info("Keeping only the last 5 interactions in short-term memory")
-                self.memory.messages=self.memory.messages[-10:]
+                self.store.trim_list(self._history_key(session_id), SHORT_TERM_MESSAGES)
 
                 
             logging.info("Successfully archived and cleared conversation history")
@@ -92,9 +119,8 @@ class MemoryManager:
             )
           
             # Generate summary
-            response = self.model.generate_content(prompt)
-            summary = response.text.strip()
-            logging.info(f"Generated summary: {summary}")
+            summary = get_provider().generate(prompt, model=self.model_name).strip()
+            logging.debug(f"Generated summary: {summary}")
             
             
             return summary
@@ -102,12 +128,12 @@ class MemoryManager:
         except Exception as e:
             logging.error("Failed to summarize conversation: %s", str(e))
             return f"Error summarizing conversation: {str(e)}"
-    def memory_execute(self, user_message: str, responder: str, bot_response: str) -> None:
+    def memory_execute(self, user_message: str, responder: str, bot_response: str, session_id: str = "default") -> None:
         """Add a user message and bot response to short-term memory."""
         try:
             logging.info("Storing conversation messages")
-            self.add_message(user_message.strip(), bot_response.strip())
-            self.archive_conversation(responder= responder)
+            self.add_message(user_message.strip(), bot_response.strip(), session_id=session_id)
+            self.archive_conversation(responder= responder, session_id=session_id)
         except Exception as e:
             logging.error("Failed to add messages to memory: %s", str(e))
             raise
@@ -121,5 +147,5 @@ if __name__ == "__main__":
     mm.add_message("Hello, how are you?", "Hi! I'm doing well, thanks for asking. How about you?")
     mm.add_message("What's the capital of France?", "The capital of France is Paris, known for its rich history and culture.")
     # Test archiving
-    archived = mm.archive_conversation()
+    archived = mm.archive_conversation(responder="AI")
     print(f"Conversation archived: {archived}")
\ No newline at end of file
@@ -1,30 +1,69 @@
-import google.generativeai as genai
+from collections import OrderedDict
+import threading
 from config import Config
-from tenacity import retry, stop_after_attempt, wait_exponential
+from services.llm import get_provider
+from services import telemetry
+from tenacity import retry, retry_if_not_exception_type, stop_after_attempt, wait_exponential
 import logging
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-genai.configure(api_key=Config.GEMINI_API_KEY)
-
 class GeminiEmbedder:
+    MODEL = "models/embedding-001"
+    # LRU cache of (provider, model, text) -> embedding; the same text is often embedded several
+    # times per request (e.g. store_chunks embeds each chunk and then searches with it).
+    _cache = OrderedDict()
+    _cache_lock = threading.Lock()
+
     @staticmethod
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
     def embed(text: str) -> list[float]:
         if not isinstance(text, str) or not text.strip():
             logging.error("Input text must be a non-empty string")
             raise ValueError("Input text must be a non-empty string")
-        
-        logging.info("Generating embedding for input text")
+
+        key = (get_provider().name, GeminiEmbedder.MODEL, text)
+        with GeminiEmbedder._cache_lock:
+            vector = GeminiEmbedder._cache.get(key)
+            if vector is not None:
+                GeminiEmbedder._cache.move_to_end(key)
+        telemetry.record_cache("embedding", hit=vector is not None)
+        if vector is not None:
+            return vector
+        # Only real embedding calls are timed, so cache hits don't dilute the stage histogram
+        with telemetry.span("embedding"):
+            vector = GeminiEmbedder._embed_uncached(text)
+        GeminiEmbedder._remember(key, vector)
+        return vector
+
+    @staticmethod
+    def clear_cache() -> None:
+        """Drop all cached embeddings, e.g. after switching providers or between benchmark runs."""
+        with GeminiEmbedder._cache_lock:
+            GeminiEmbedder._cache.clear()
+
+    @staticmethod
+    def _remember(key: tuple, vector: list[float]) -> None:
+        if Config.EMBEDDING_CACHE_SIZE <= 0:
+            return
+        with GeminiEmbedder._cache_lock:
+            GeminiEmbedder._cache[key] = vector
+            GeminiEmbedder._cache.move_to_end(key)
+            while len(GeminiEmbedder._cache) > Config.EMBEDDING_CACHE_SIZE:
+                GeminiEmbedder._cache.popitem(last=False)
+
+    @staticmethod
+    # A cassette replay miss (LookupError) is deterministic, so it is raised at once without retries
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10),
+           retry=retry_if_not_exception_type(LookupError))
+    def _embed_uncached(text: str) -> list[float]:
+        logging.debug("Generating embedding for input text")
         try:
-            response = genai.embed_content(
-                model="models/embedding-001",
-                content=text,
-                task_type="retrieval_document"
-            )
-            logging.info("Successfully generated embedding")
-            return response["embedding"]
+            embedding = get_provider().embed(text, model=GeminiEmbedder.MODEL)
+            logging.debug("Successfully generated embedding")
+            return embedding
+        except LookupError:
+            raise
         except Exception as e:
             logging.error(f"Failed to generate embedding: {str(e)}")
             raise ValueError(f"Failed to generate embedding: {str(e)}")
@@ -0,0 +1,270 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import re
+import threading
+import time
+from config import Config
+from services import telemetry
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+EMBEDDING_DIM = 768
+# Prompt content that changes between a recording and its replay, such as the time in the
+# conversation-archive prompt; it is masked before a request is keyed
+VOLATILE_PATTERNS = [
+    (re.compile(r"\b\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?\b"), "<timestamp>"),
+]
+
+
+class LatencyModel:
+    """
+    Samples simulated call latencies (in seconds) from a distribution spec such as
+    "0", "fixed:0.05", "uniform:0.02:0.1", "normal:0.3:0.05" or "lognormal:-1.5:0.4".
+    """
+
+    def __init__(self, spec: str = "0", seed: int = 0):
+        self.spec = spec or "0"
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        kind, *params = self.spec.split(":")
+        try:
+            if not params:
+                kind, params = "fixed", [float(kind)]
+            else:
+                params = [float(p) for p in params]
+        except ValueError:
+            raise ValueError(f"Invalid latency spec: {self.spec}")
+        expected = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+        if expected.get(kind) != len(params):
+            raise ValueError(f"Invalid latency spec: {self.spec}")
+        self.kind = kind
+        self.params = params
+
+    def sample(self) -> float:
+        with self._lock:
+            if self.kind == "fixed":
+                value = self.params[0]
+            elif self.kind == "uniform":
+                value = self._rng.uniform(*self.params)
+            elif self.kind == "normal":
+                value = self._rng.gauss(*self.params)
+            else:
+                value = self._rng.lognormvariate(*self.params)
+        return max(0.0, value)
+
+    def wait(self) -> None:
+        delay = self.sample()
+        if delay:
+            time.sleep(delay)
+
+
+class LLMProvider:
+    """Text generation and embedding backend used by every module instead of calling Gemini directly."""
+
+    name = "base"
+
+    def generate(self, prompt: str, model: str = 'gemini-2.0-flash') -> str:
+        raise NotImplementedError
+
+    def embed(self, text: str, model: str = "models/embedding-001") -> list[float]:
+        raise NotImplementedError
+
+
+class GeminiProvider(LLMProvider):
+    """Live Google Gemini backend."""
+
+    name = "gemini"
+
+    def __init__(self, api_key: str = None):
+        import google.generativeai as genai
+        self._genai = genai
+        self._genai.configure(api_key=api_key or Config.GEMINI_API_KEY)
+        self._models = {}
+
+    def generate(self, prompt: str, model: str = 'gemini-2.0-flash') -> str:
+        if model not in self._models:
+            self._models[model] = self._genai.GenerativeModel(model)
+        with telemetry.external_call("gemini", "generate"):
+            response = self._models[model].generate_content(prompt)
+        usage = getattr(response, "usage_metadata", None)
+        if usage:
+            telemetry.record_tokens(model, usage.prompt_token_count, usage.candidates_token_count)
+        else:
+            telemetry.record_tokens(model, telemetry.estimate_tokens(prompt), telemetry.estimate_tokens(response.text))
+        return response.text
+
+    def embed(self, text: str, model: str = "models/embedding-001") -> list[float]:
+        with telemetry.external_call("gemini", "embed"):
+            response = self._genai.embed_content(
+                model=model,
+                content=text,
+                task_type="retrieval_document"
+            )
+        telemetry.record_tokens(model, telemetry.estimate_tokens(text), 0)
+        return response["embedding"]
+
+
+class FakeProvider(LLMProvider):
+    """
+    Deterministic offline backend for benchmarks and load tests.
+
+    Embeddings are hashed bag-of-words vectors, so texts sharing words land close
+    together under cosine similarity. Generated text is picked from `rules`, a list of
+    (regex, reply) pairs matched against the prompt, and otherwise derived from a hash
+    of the prompt. Each call sleeps for a latency sampled from the configured model.
+    """
+
+    name = "fake"
+
+    def __init__(self, generate_latency: str = "0", embed_latency: str = "0",
+                 rules: list[tuple[str, str]] = None, dim: int = EMBEDDING_DIM, seed: int = 0):
+        self.generate_latency = LatencyModel(generate_latency, seed=seed)
+        self.embed_latency = LatencyModel(embed_latency, seed=seed + 1)
+        self.rules = [(re.compile(pattern, re.IGNORECASE | re.DOTALL), reply) for pattern, reply in (rules or [])]
+        self.dim = dim
+
+    def generate(self, prompt: str, model: str = 'gemini-2.0-flash') -> str:
+        with telemetry.external_call("fake", "generate"):
+            self.generate_latency.wait()
+            reply = self._reply(prompt, model)
+        telemetry.record_tokens(model, telemetry.estimate_tokens(prompt), telemetry.estimate_tokens(reply))
+        return reply
+
+    def _reply(self, prompt: str, model: str) -> str:
+        for pattern, reply in self.rules:
+            if pattern.search(prompt):
+                return reply
+        digest = hashlib.sha256(f"{model}\n{prompt}".encode("utf-8")).hexdigest()
+        return f"Deterministic response {digest[:16]}."
+
+    def embed(self, text: str, model: str = "models/embedding-001") -> list[float]:
+        with telemetry.external_call("fake", "embed"):
+            self.embed_latency.wait()
+        telemetry.record_tokens(model, telemetry.estimate_tokens(text), 0)
+        vector = [0.0] * self.dim
+        tokens = re.findall(r"\w+", text.lower()) or [text]
+        for token in tokens:
+            digest = hashlib.sha256(token.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "big") % self.dim
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+
+class CassetteProvider(LLMProvider):
+    """
+    Record/replay backend. In "record" mode calls go to `inner` and every response is
+    appended to a JSONL cassette ({"key", "response"} per line) keyed by a hash of the
+    request; in "replay" mode responses are served from the cassette only and unknown
+    requests raise LookupError. Timestamps in prompts are masked before keying, so a prompt
+    that mentions the current time still replays. Cassettes in the older single-object JSON
+    format still load.
+    """
+
+    def __init__(self, path: str, mode: str = "replay", inner: LLMProvider = None):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        if mode == "record" and inner is None:
+            raise ValueError("Record mode requires an inner provider")
+        self.name = mode
+        self.path = path
+        self.mode = mode
+        self.inner = inner
+        self._lock = threading.Lock()
+        self._entries = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    if "key" in entry and "response" in entry:
+                        self._entries[entry["key"]] = entry["response"]
+                    else:
+                        self._entries.update(entry)  # older cassettes: one {key: response} object
+            logging.info(f"Loaded {len(self._entries)} cassette entries from {path}")
+        elif mode == "replay":
+            raise FileNotFoundError(f"Cassette not found: {path}")
+
+    @staticmethod
+    def _key(kind: str, model: str, payload: str) -> str:
+        for pattern, placeholder in VOLATILE_PATTERNS:
+            payload = pattern.sub(placeholder, payload)
+        return hashlib.sha256(f"{kind}\n{model}\n{payload}".encode("utf-8")).hexdigest()
+
+    def _call(self, kind: str, model: str, payload: str, fn):
+        key = self._key(kind, model, payload)
+        with self._lock:
+            if key in self._entries:
+                telemetry.record_cache("cassette", hit=True)
+                return self._entries[key]
+        telemetry.record_cache("cassette", hit=False)
+        if self.mode == "replay":
+            raise LookupError(f"No recorded {kind} response for request {key[:12]}")
+        result = fn()
+        with self._lock:
+            self._entries[key] = result
+            self._append(key, result)
+        return result
+
+    def _append(self, key: str, result) -> None:
+        # One line per recorded call, so recording stays linear in the number of calls
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"key": key, "response": result}) + "\n")
+
+    def generate(self, prompt: str, model: str = 'gemini-2.0-flash') -> str:
+        return self._call("generate", model, prompt, lambda: self.inner.generate(prompt, model=model))
+
+    def embed(self, text: str, model: str = "models/embedding-001") -> list[float]:
+        return self._call("embed", model, text, lambda: self.inner.embed(text, model=model))
+
+
+def create_provider(name: str = None) -> LLMProvider:
+    """Build the provider selected by `name` or Config.LLM_PROVIDER."""
+    name = (name or Config.LLM_PROVIDER).lower()
+    if name == "gemini":
+        return GeminiProvider()
+    if name == "fake":
+        rules = None
+        if Config.FAKE_RULES:
+            with open(Config.FAKE_RULES, "r", encoding="utf-8") as f:
+                rules = [tuple(rule) for rule in json.load(f)]
+        return FakeProvider(
+            generate_latency=Config.FAKE_GENERATE_LATENCY,
+            embed_latency=Config.FAKE_EMBED_LATENCY,
+            rules=rules
+        )
+    if name == "record":
+        return CassetteProvider(Config.LLM_CASSETTE, mode="record", inner=GeminiProvider())
+    if name == "replay":
+        return CassetteProvider(Config.LLM_CASSETTE, mode="replay")
+    raise ValueError(f"Unknown LLM provider: {name}")
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_provider() -> LLMProvider:
+    """Return the process-wide provider, creating it on first use."""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = create_provider()
+                logging.info(f"Using LLM provider: {_provider.name}")
+    return _provider
+
+
+def set_provider(provider: LLMProvider) -> None:
+    """Override the process-wide provider, e.g. with a FakeProvider in benchmarks."""
+    global _provider
+    with _provider_lock:
+        _provider = provider
+    from services.embeddings import GeminiEmbedder  # deferred: embeddings imports this module
+    GeminiEmbedder.clear_cache()
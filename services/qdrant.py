@@ -1,10 +1,12 @@
 import sys
 sys.path.append('.')
-from qdrant_client import QdrantClient
-from qdrant_client.models import PointStruct, VectorParams, Distance
 from config import Config
 from services.embeddings import GeminiEmbedder
+from services import telemetry
+import contextlib
 import logging
+import threading
+import uuid
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -12,7 +14,12 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 class QdrantManager:
     def __init__(self):
         logging.info("Initializing QdrantManager")
-        self.client = QdrantClient(url=Config.QDRANT_URL)
+        from qdrant_client import QdrantClient  # deferred: heavy import
+        self.location = Config.QDRANT_URL
+        self.client = QdrantClient(location=self.location)  # ":memory:" runs an in-process instance
+        # The in-process instance is not thread-safe; a real server handles concurrency itself
+        self._lock = threading.RLock() if Config.QDRANT_URL == ":memory:" else contextlib.nullcontext()
+        self._known_collections = set()
         self._ensure_collections()
     
     def _ensure_collections(self,collection=None):
@@ -20,27 +27,50 @@ class QdrantManager:
         if collection:
             collections=[collection]
         if not collections:
-            collections = ["book_chunks", "conversations"]
+            collections = ["book_chunks", "conversations", "chapters"]
         for name in collections:
-            if not self.client.collection_exists(collection_name=name):
+            if name in self._known_collections:
+                continue
+            with telemetry.external_call("qdrant", "collection_exists"), self._lock:
+                exists = self.client.collection_exists(collection_name=name)
+            if not exists:
                 logging.info(f"Creating missing collection: {name}")
-                self.client.create_collection(
-                    collection_name=name,
-                    vectors_config=VectorParams(size=768, distance=Distance.COSINE)
-                )
+                from qdrant_client.models import VectorParams, Distance
+                with telemetry.external_call("qdrant", "create_collection"), self._lock:
+                    self.client.create_collection(
+                        collection_name=name,
+                        vectors_config=VectorParams(size=768, distance=Distance.COSINE)
+                    )
             else:
                 logging.info(f"Collection {name} already exists")
+            if name == "book_chunks" and self.location != ":memory:":
+                # Keyword indexes so chapter- and character-scoped searches filter without a full payload
+                # scan. Creating an existing index is a no-op, so collections from older deployments get them too.
+                from qdrant_client.models import PayloadSchemaType
+                for field in ("chapter_id", "characters"):
+                    with telemetry.external_call("qdrant", "create_payload_index"):
+                        self.client.create_payload_index(
+                            collection_name=name,
+                            field_name=field,
+                            field_schema=PayloadSchemaType.KEYWORD
+                        )
+            self._known_collections.add(name)
     
     
     def store_chunks(self, chunks: list[str], collection: str = "book_chunks", similarity_threshold: float = 0.9):
         """
         Store chunks in the specified collection, updating similar memories if found.
         """
+        with telemetry.span("store_chunks"):
+            self._store_chunks(chunks, collection, similarity_threshold)
+
+    def _store_chunks(self, chunks: list[str], collection: str, similarity_threshold: float):
         if not chunks:
             logging.warning("No chunks provided for storage")
             return
         
         logging.info(f"Processing {len(chunks)} chunks for storage in collection {collection}")
+        from qdrant_client.models import PointStruct
         points_to_upsert = []
 
         self._ensure_collections(collection)
@@ -56,11 +86,11 @@ class QdrantManager:
                 existing_text = top_result.payload["text"]
                 
                 if chunk == existing_text:
-                    logging.info(f"Exact match found for chunk {idx}, skipping storage")
+                    logging.debug(f"Exact match found for chunk {idx}, skipping storage")
                     continue
                 
                 if similarity_score >= similarity_threshold:
-                    logging.info(f"Similar memory found (score: {similarity_score}) for chunk {idx}, updating existing")
+                    logging.debug(f"Similar memory found (score: {similarity_score}) for chunk {idx}, updating existing")
                     points_to_upsert.append(
                         PointStruct(
                             id=top_result.id,  # Overwrite the existing memory
@@ -70,10 +100,10 @@ class QdrantManager:
                     )
                     continue
             
-            logging.info(f"No match found for chunk {idx}, adding as new memory")
+            logging.debug(f"No match found for chunk {idx}, adding as new memory")
             points_to_upsert.append(
                 PointStruct(
-                    id=idx + self._get_next_id(collection),
+                    id=str(uuid.uuid4()),  # count-based ids collide when workers store concurrently
                     vector=vector,
                     payload={"text": chunk}
                 )
@@ -81,55 +111,147 @@ class QdrantManager:
         
         if points_to_upsert:
             logging.info(f"Upserting {len(points_to_upsert)} points into collection {collection}")
-            self.client.upsert(
-                collection_name=collection,
-                points=points_to_upsert
-            )
+            with telemetry.external_call("qdrant", "upsert"), self._lock:
+                self.client.upsert(
+                    collection_name=collection,
+                    points=points_to_upsert
+                )
         else:
             logging.info("No new or updated points to upsert")
     
-    def _get_next_id(self, collection: str) -> int:
-        """Get the next available ID by checking the current number of points in the collection."""
+    def upsert_chunks(self, chunks: list[dict], ids: list[str], collection: str = "book_chunks"):
+        """
+        Embed and upsert chunks under caller-chosen ids, without similarity checks.
+        Chunk metadata is stored alongside the text in the payload.
+        """
+        if not chunks:
+            return
+        from qdrant_client.models import PointStruct
+        self._ensure_collections(collection)
+        with telemetry.span("store_chunks"):
+            points = [
+                PointStruct(
+                    id=point_id,
+                    vector=GeminiEmbedder.embed(text=chunk["text"]),
+                    payload={"text": chunk["text"], **chunk.get("metadata", {})}
+                )
+                for chunk, point_id in zip(chunks, ids)
+            ]
+            logging.info(f"Upserting {len(points)} points into collection {collection}")
+            with telemetry.external_call("qdrant", "upsert"), self._lock:
+                self.client.upsert(collection_name=collection, points=points)
+
+    def existing_ids(self, ids: list[str], collection: str = "book_chunks", batch_size: int = 256) -> set:
+        """Subset of `ids` that exist as points in `collection` (none if the collection is gone)."""
+        found = set()
         try:
-            count = self.client.count(collection_name=collection).count
-            return count
+            self._ensure_collections(collection)
+            for start in range(0, len(ids), batch_size):
+                with telemetry.external_call("qdrant", "retrieve"), self._lock:
+                    points = self.client.retrieve(
+                        collection_name=collection,
+                        ids=ids[start:start + batch_size],
+                        with_payload=False,
+                        with_vectors=False
+                    )
+                found.update(str(point.id) for point in points)
         except Exception as e:
-            logging.error(f"Failed to get count for collection {collection}: {str(e)}")
-            return 0
+            # e.g. the collection was dropped after we cached its existence; recreate it on next use
+            logging.warning(f"Could not look up points in collection {collection}: {e}")
+            self._known_collections.discard(collection)
+        return found
+
+    def tag_chunks(self, tags: dict, key: str, collection: str = "book_chunks"):
+        """
+        Set payload `key` to a list of tags on existing points, given {point id: [tags]}.
+        Points sharing the same tags are updated in one call.
+        """
+        groups = {}
+        for point_id, values in tags.items():
+            groups.setdefault(tuple(values), []).append(point_id)
+        for values, point_ids in groups.items():
+            with telemetry.external_call("qdrant", "set_payload"), self._lock:
+                self.client.set_payload(collection_name=collection, payload={key: list(values)}, points=point_ids)
+        logging.info(f"Tagged {len(tags)} points in collection {collection} with {key}")
+
     def search_memories(self, query: str, limit: int = 3, collection: str = "conversations"):
-        logging.info(f"Searching memories in collection {collection} with query: {query}")
+        logging.debug(f"Searching memories in collection {collection} with query: {query[:50]}")
         vector = GeminiEmbedder.embed(query)
-        results = self.client.search(
-            collection_name=collection,
-            query_vector=vector,
-            limit=limit
-        )
-        logging.info(f"Search returned {len(results)} results")
+        with telemetry.external_call("qdrant", "search"), self._lock:
+            results = self.client.search(
+                collection_name=collection,
+                query_vector=vector,
+                limit=limit
+            )
+        logging.debug(f"Search returned {len(results)} results")
         return results
-    def retrieve_memory(self, query, similarity_threshold=0.8, limit=5, collection=None):
+    def search_chapters(self, query: str, limit: int = 3) -> list[str]:
+        """
+        Ids of the chapters whose summary vectors best match the query.
+        """
+        return self._search_chapters(GeminiEmbedder.embed(text=query), limit)
+
+    def _search_chapters(self, vector, limit):
+        with telemetry.external_call("qdrant", "search"), self._lock:
+            results = self.client.search(
+                collection_name="chapters",
+                query_vector=vector,
+                limit=limit
+            )
+        chapter_ids = [result.payload["chapter_id"] for result in results]
+        logging.debug(f"Top chapters: {[result.payload.get('title') for result in results]}")
+        return chapter_ids
+
+    def retrieve_memory(self, query, similarity_threshold=0.8, limit=5, collection=None,
+                        chapter_ids=None, top_chapters=0, character=None):
         """
         Retrieve memories (chunks) from the specified collection based on a query and similarity threshold.
+        Book chunks can be restricted to `chapter_ids` or to passages mentioning `character`; with
+        `top_chapters` set (and no character), the best matching chapters are found first and only
+        their chunks are searched (two-stage retrieval).
         """
+        with telemetry.span("retrieval"):
+            return self._retrieve_memory(query, similarity_threshold, limit, collection,
+                                         chapter_ids, top_chapters, character)
+
+    def _retrieve_memory(self, query, similarity_threshold, limit, collection, chapter_ids, top_chapters,
+                         character):
         collections=[]
         if collection:
             collections=[collection]
 
         if not collection:
             collections = ["conversations", "book_chunks"]
+
+        # Generate embedding for the query
+        vector = GeminiEmbedder.embed(text=query)
+        if top_chapters and chapter_ids is None and not character and "book_chunks" in collections:
+            # An empty chapter index (e.g. books ingested before chapters existed) searches everything
+            chapter_ids = self._search_chapters(vector, top_chapters) or None
+
         matching_chunks = []
         for collection in collections:
-            logging.info(f"Retrieving memories from collection {collection} with query: {query}")
-            logging.info(f"Using similarity threshold: {similarity_threshold}, limit: {limit}")
-            
-            # Generate embedding for the query
-            vector = GeminiEmbedder.embed(text=query)
-            
+            logging.debug(f"Retrieving memories from collection {collection} with query: {query[:50]}")
+            logging.debug(f"Using similarity threshold: {similarity_threshold}, limit: {limit}")
+
+            query_filter = None
+            if collection == "book_chunks" and (chapter_ids or character):
+                from qdrant_client.models import Filter, FieldCondition, MatchAny, MatchValue
+                conditions = []
+                if chapter_ids:
+                    conditions.append(FieldCondition(key="chapter_id", match=MatchAny(any=chapter_ids)))
+                if character:
+                    conditions.append(FieldCondition(key="characters", match=MatchValue(value=character)))
+                query_filter = Filter(must=conditions)
+
             # Search the collection
-            search_results = self.client.search(
-                collection_name=collection,
-                query_vector=vector,
-                limit=limit
-            )
+            with telemetry.external_call("qdrant", "search"), self._lock:
+                search_results = self.client.search(
+                    collection_name=collection,
+                    query_vector=vector,
+                    query_filter=query_filter,
+                    limit=limit
+                )
             
             # Filter results based on similarity threshold
             
@@ -141,7 +263,7 @@ class QdrantManager:
                         "id": result.id
                     }
                     matching_chunks.append(chunk_info)
-                    logging.info(f"Found matching chunk (score: {result.score}): {result.payload['text'][:50]}...")
+                    logging.debug(f"Found matching chunk (score: {result.score}): {result.payload['text'][:50]}...")
         
         logging.info(f"Retrieved {len(matching_chunks)} chunks meeting similarity threshold")
         
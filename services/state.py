@@ -0,0 +1,265 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from config import Config
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+class StateStore:
+    """
+    Key/value store for state shared by all workers (loaded characters, chat history).
+    Values must be JSON-serializable.
+    """
+
+    def get(self, key: str, default=None):
+        raise NotImplementedError
+
+    def set(self, key: str, value) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def add_to_set(self, key: str, members) -> None:
+        """Atomically add string members to the set at `key`, so concurrent writers never lose entries."""
+        raise NotImplementedError
+
+    def set_size(self, key: str) -> int:
+        raise NotImplementedError
+
+    def append_to_list(self, key: str, values) -> None:
+        """Atomically append JSON-serializable values to the list at `key`."""
+        raise NotImplementedError
+
+    def trim_list(self, key: str, max_length: int) -> None:
+        """Atomically drop the oldest entries of the list at `key` beyond `max_length`."""
+        raise NotImplementedError
+
+    def get_list(self, key: str) -> list:
+        raise NotImplementedError
+
+
+class MemoryStateStore(StateStore):
+    """Process-local store; only correct with a single worker."""
+
+    def __init__(self):
+        self._data = {}
+        self._sets = {}
+        self._lists = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            raw = self._data.get(key)
+        return json.loads(raw) if raw is not None else default
+
+    def set(self, key: str, value) -> None:
+        raw = json.dumps(value)
+        with self._lock:
+            self._data[key] = raw
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+            self._sets.pop(key, None)
+            self._lists.pop(key, None)
+
+    def add_to_set(self, key: str, members) -> None:
+        with self._lock:
+            self._sets.setdefault(key, set()).update(members)
+
+    def set_size(self, key: str) -> int:
+        with self._lock:
+            return len(self._sets.get(key, ()))
+
+    def append_to_list(self, key: str, values) -> None:
+        raws = [json.dumps(value) for value in values]
+        with self._lock:
+            self._lists.setdefault(key, []).extend(raws)
+
+    def trim_list(self, key: str, max_length: int) -> None:
+        with self._lock:
+            if key in self._lists:
+                self._lists[key] = self._lists[key][-max_length:] if max_length > 0 else []
+
+    def get_list(self, key: str) -> list:
+        with self._lock:
+            raws = list(self._lists.get(key, []))
+        return [json.loads(raw) for raw in raws]
+
+
+class SqliteStateStore(StateStore):
+    """SQLite-backed store shared by all worker processes on one host."""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS state_sets (key TEXT NOT NULL, member TEXT NOT NULL, "
+                "PRIMARY KEY (key, member)) WITHOUT ROWID"
+            )
+            # One row per list entry, so appends never rewrite (and race with) the rest of the list
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS state_lists (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "key TEXT NOT NULL, value TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS state_lists_key ON state_lists (key, id)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # A connection per operation keeps the store safe across threads and processes.
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, key: str, default=None):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        finally:
+            conn.close()
+        return json.loads(row[0]) if row else default
+
+    def set(self, key: str, value) -> None:
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT INTO state (key, value) VALUES (?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                    (key, json.dumps(value))
+                )
+        finally:
+            conn.close()
+
+    def delete(self, key: str) -> None:
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM state WHERE key = ?", (key,))
+                conn.execute("DELETE FROM state_sets WHERE key = ?", (key,))
+                conn.execute("DELETE FROM state_lists WHERE key = ?", (key,))
+        finally:
+            conn.close()
+
+    def add_to_set(self, key: str, members) -> None:
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO state_sets (key, member) VALUES (?, ?)",
+                    [(key, member) for member in members]
+                )
+        finally:
+            conn.close()
+
+    def set_size(self, key: str) -> int:
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM state_sets WHERE key = ?", (key,)).fetchone()[0]
+        finally:
+            conn.close()
+
+    def append_to_list(self, key: str, values) -> None:
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO state_lists (key, value) VALUES (?, ?)",
+                    [(key, json.dumps(value)) for value in values]
+                )
+        finally:
+            conn.close()
+
+    def trim_list(self, key: str, max_length: int) -> None:
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "DELETE FROM state_lists WHERE key = ? AND id NOT IN "
+                    "(SELECT id FROM state_lists WHERE key = ? ORDER BY id DESC LIMIT ?)",
+                    (key, key, max(max_length, 0))
+                )
+        finally:
+            conn.close()
+
+    def get_list(self, key: str) -> list:
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT value FROM state_lists WHERE key = ? ORDER BY id", (key,)).fetchall()
+        finally:
+            conn.close()
+        return [json.loads(row[0]) for row in rows]
+
+
+class RedisStateStore(StateStore):
+    """Redis-backed store shared by workers on any host. Requires the `redis` package."""
+
+    def __init__(self, url: str, prefix: str = "bookchat:"):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key: str, default=None):
+        raw = self.client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else default
+
+    def set(self, key: str, value) -> None:
+        self.client.set(self.prefix + key, json.dumps(value))
+
+    def delete(self, key: str) -> None:
+        self.client.delete(self.prefix + key)
+
+    def add_to_set(self, key: str, members) -> None:
+        members = list(members)
+        if members:
+            self.client.sadd(self.prefix + key, *members)
+
+    def set_size(self, key: str) -> int:
+        return self.client.scard(self.prefix + key)
+
+    def append_to_list(self, key: str, values) -> None:
+        values = [json.dumps(value) for value in values]
+        if values:
+            self.client.rpush(self.prefix + key, *values)
+
+    def trim_list(self, key: str, max_length: int) -> None:
+        if max_length <= 0:
+            self.client.delete(self.prefix + key)
+        else:
+            self.client.ltrim(self.prefix + key, -max_length, -1)
+
+    def get_list(self, key: str) -> list:
+        return [json.loads(raw) for raw in self.client.lrange(self.prefix + key, 0, -1)]
+
+
+def create_state_store(url: str = None) -> StateStore:
+    """Build the store for `url` or Config.STATE_STORE_URL ("memory://", "sqlite:///path", "redis://...")."""
+    url = url or Config.STATE_STORE_URL
+    if url.startswith("memory://"):
+        return MemoryStateStore()
+    if url.startswith("sqlite:///"):
+        return SqliteStateStore(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://")):
+        return RedisStateStore(url)
+    raise ValueError(f"Unsupported state store URL: {url}")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_state_store() -> StateStore:
+    """Return the process-wide state store, creating it on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = create_state_store()
+                logging.info(f"Using state store: {type(_store).__name__}")
+    return _store
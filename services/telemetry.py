@@ -0,0 +1,305 @@
+import atexit
+import contextlib
+import contextvars
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{escaped}"')
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic counter with a fixed set of label names."""
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(labels.get(n, "") for n in self.labels), 0.0)
+
+    def empty(self):
+        return type(self)(self.name, self.documentation, self.labels)
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def merge(self, snapshot: list) -> None:
+        """Add another process's values (counters sum across processes)."""
+        with self._lock:
+            for key, value in snapshot:
+                key = tuple(key)
+                self._values[key] = self._values.get(key, 0.0) + value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items(), key=lambda item: str(item[0])):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {value:g}")
+        return lines
+
+
+class Gauge(Counter):
+    """Value that can go up or down. Label gauges by pid to keep one series per process."""
+
+    def set(self, value: float, **labels) -> None:
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self._lock:
+            self._values[key] = value
+
+    def merge(self, snapshot: list) -> None:
+        with self._lock:
+            for key, value in snapshot:
+                self._values[tuple(key)] = value
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with a fixed set of label names."""
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self._lock:
+            series = self._series.setdefault(key, {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def empty(self):
+        return type(self)(self.name, self.documentation, self.labels, self.buckets)
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [[list(key), json.loads(json.dumps(series))] for key, series in self._series.items()]
+
+    def merge(self, snapshot: list) -> None:
+        """Add another process's observations (bucket counts, sums and counts all add up)."""
+        with self._lock:
+            for key, other in snapshot:
+                series = self._series.setdefault(tuple(key), {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+                series["buckets"] = [a + b for a, b in zip(series["buckets"], other["buckets"])]
+                series["sum"] += other["sum"]
+                series["count"] += other["count"]
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items(), key=lambda item: str(item[0])):
+                for bound, count in zip(self.buckets, series["buckets"]):
+                    le = 'le="%g"' % bound
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {count}")
+                le = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {series['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {series['sum']:g}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {series['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Metrics of this process. With a shared directory, every process writes a snapshot
+    (metrics-<pid>.json) and any process can render the sum over all of them, so one
+    scrape of a multi-worker server sees every worker.
+    """
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def write_snapshot(self, directory: str) -> None:
+        snapshot = {metric.name: metric.snapshot() for metric in self._metrics}
+        path = os.path.join(directory, f"metrics-{os.getpid()}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, path)
+
+    def read_snapshots(self, directory: str, max_age: float = None) -> list[dict]:
+        """Snapshots of all processes; with `max_age`, only those written in the last `max_age` seconds."""
+        snapshots = []
+        for path in glob.glob(os.path.join(directory, "metrics-*.json")):
+            try:
+                if max_age is not None and time.time() - os.path.getmtime(path) > max_age:
+                    continue
+                with open(path, "r", encoding="utf-8") as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # removed or being replaced by another process
+        return snapshots
+
+    def render(self, directory: str = None) -> str:
+        """Prometheus text exposition format (version 0.0.4), summed over all processes if `directory` is set."""
+        metrics = self._metrics
+        if directory:
+            self.write_snapshot(directory)
+            metrics = [metric.empty() for metric in self._metrics]
+            for snapshot in self.read_snapshots(directory):
+                for metric in metrics:
+                    metric.merge(snapshot.get(metric.name, []))
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "stage_duration_seconds", "Latency of pipeline stages.", labels=("stage",)))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "Latency of HTTP requests.", labels=("endpoint", "method", "status")))
+EXTERNAL_CALLS = REGISTRY.register(Counter(
+    "external_calls_total", "Calls to external services.", labels=("service", "operation", "status")))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "llm_tokens_total", "LLM tokens consumed (estimated when the backend does not report usage).",
+    labels=("model", "kind")))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "cache_requests_total", "Cache lookups by result; hit rate = hit / (hit + miss).", labels=("cache", "result")))
+WORKER_READY = REGISTRY.register(Gauge(
+    "worker_ready", "1 once a worker process has initialized its components, else 0.", labels=("pid",)))
+
+_exporter = {"directory": None, "interval": None}
+
+
+def start_exporter(directory: str, interval: float = 5.0) -> None:
+    """
+    Write this process's metrics snapshot to `directory` now, every `interval` seconds and at
+    exit, so /metrics and /ready on any worker can aggregate all workers.
+    """
+    if _exporter["directory"]:
+        return
+    os.makedirs(directory, exist_ok=True)
+    _exporter.update(directory=directory, interval=interval)
+
+    def run():
+        while True:
+            time.sleep(interval)
+            flush()
+
+    flush()
+    threading.Thread(target=run, daemon=True, name="metrics-exporter").start()
+    atexit.register(flush)
+
+
+def flush() -> None:
+    """Write the snapshot immediately (e.g. after a readiness change), if exporting."""
+    if _exporter["directory"]:
+        try:
+            REGISTRY.write_snapshot(_exporter["directory"])
+        except OSError as e:
+            logging.warning(f"Could not write metrics snapshot: {e}")
+
+
+def worker_readiness(directory: str, max_age: float) -> dict:
+    """{pid: ready} for worker processes that wrote a snapshot within `max_age` seconds."""
+    workers = {}
+    for snapshot in REGISTRY.read_snapshots(directory, max_age=max_age):
+        for key, value in snapshot.get(WORKER_READY.name, []):
+            workers[str(key[0])] = bool(value)
+    return workers
+
+_trace = contextvars.ContextVar("trace", default=None)
+
+
+def start_trace() -> list:
+    """Begin collecting spans for the current request/context and return the span list."""
+    spans = []
+    _trace.set(spans)
+    return spans
+
+
+def current_trace() -> list:
+    return _trace.get()
+
+
+@contextlib.contextmanager
+def span(stage: str):
+    """Time a pipeline stage, feeding the stage histogram and the current trace."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        spans = _trace.get()
+        if spans is not None:
+            spans.append((stage, elapsed))
+        logging.debug(f"Stage {stage} took {elapsed * 1000:.1f} ms")
+
+
+@contextlib.contextmanager
+def external_call(service: str, operation: str):
+    """Count a call to an external service by outcome and time it as a span."""
+    status = "ok"
+    try:
+        with span(f"{service}.{operation}"):
+            yield
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        EXTERNAL_CALLS.inc(service=service, operation=operation, status=status)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token) for backends without usage data."""
+    return max(1, len(text) // 4) if text else 0
+
+
+def record_tokens(model: str, prompt_tokens: int, completion_tokens: int) -> None:
+    LLM_TOKENS.inc(prompt_tokens, model=model, kind="prompt")
+    LLM_TOKENS.inc(completion_tokens, model=model, kind="completion")
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def server_timing(spans: list) -> str:
+    """Format spans as a Server-Timing header value, summing repeated stages."""
+    totals = {}
+    for stage, elapsed in spans:
+        totals[stage] = totals.get(stage, 0.0) + elapsed
+    return ", ".join(f"{stage};dur={elapsed * 1000:.3f}" for stage, elapsed in totals.items())
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Tests import the app's modules the same way the app does, from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ.setdefault("QDRANT_URL", ":memory:")
+os.environ.setdefault("STATE_STORE_URL", "memory://")
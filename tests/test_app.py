@@ -0,0 +1,41 @@
+import pytest
+
+from benchmarks import harness
+from services.llm import set_provider
+
+
+@pytest.fixture
+def app():
+    set_provider(harness.make_provider())
+    try:
+        with harness.quiet(), harness.fresh_app() as app:
+            app.save_characters(harness.CHARACTERS)
+            yield app
+    finally:
+        set_provider(None)
+
+
+def test_chat_without_session_issues_a_cookie_and_keeps_history_per_browser(app):
+    first_browser, second_browser = app.app.test_client(), app.app.test_client()
+
+    response = first_browser.post("/chat", data={"message": "Alice Thorn, where is your brother?"})
+    assert response.status_code == 200
+    cookie = first_browser.get_cookie("session_id")
+    assert cookie is not None and cookie.http_only
+
+    response = first_browser.post("/chat", data={"message": "Alice Thorn, and the map?"})
+    assert "session_id" not in response.headers.get("Set-Cookie", "")
+    second_browser.post("/chat", data={"message": "Alice Thorn, hello."})
+    assert second_browser.get_cookie("session_id").value != cookie.value
+
+    memory = app.get_components()['memory']
+    assert [m.content for m in memory.history(cookie.value).messages if m.type == "human"] == [
+        "Alice Thorn, where is your brother?", "Alice Thorn, and the map?"
+    ]
+
+
+def test_explicit_session_id_gets_no_cookie(app):
+    client = app.app.test_client()
+    client.post("/chat", data={"message": "Alice Thorn, hello.", "session_id": "mine"})
+    assert client.get_cookie("session_id") is None
+    assert len(app.get_components()['memory'].history("mine").messages) == 2
@@ -0,0 +1,76 @@
+import io
+
+import pytest
+
+from modules.book_processor import BookProcessor
+
+
+@pytest.fixture(scope="module")
+def processor():
+    return BookProcessor()
+
+
+def titles(processor, text):
+    return [chapter["title"] for chapter in processor.detect_chapters(text)]
+
+
+def test_headings_after_blank_lines(processor):
+    text = "CHAPTER XII\n\nThe rain fell.\n\nChapter Twenty-One: The Crossing\n\nThey crossed."
+    assert titles(processor, text) == ["CHAPTER XII", "Chapter Twenty-One: The Crossing"]
+
+
+def test_heading_after_page_break(processor):
+    text = "Prologue\n\nIt began.\n\f\nChapter 3\nThe third part."
+    assert titles(processor, text) == ["Prologue", "Chapter 3"]
+
+
+@pytest.mark.parametrize("first, second", [("Chapter 1.", "Chapter 2."), ("CHAPTER I.", "CHAPTER II.")])
+def test_headings_with_a_trailing_period(processor, first, second):
+    text = f"{first}\n\nText here.\n\n{second}\n\nMore."
+    assert titles(processor, text) == [first, second]
+
+
+@pytest.mark.parametrize("line", [
+    "Book I had lent her fell from the shelf.",
+    "Chapter Two ended badly, he said.",
+    "Chapter 4: The night they left.",
+    "Part of me wanted to stay",
+])
+def test_prose_is_not_a_heading(processor, line):
+    text = f"Chapter 1\n\nIt was late.\n\n{line}\n\nThen morning."
+    assert titles(processor, text) == ["Chapter 1"]
+
+
+def test_text_without_headings_is_one_chapter(processor):
+    assert titles(processor, "Just a story.\n\nWith paragraphs.") == ["Full text"]
+
+
+def test_text_before_the_first_heading_is_front_matter(processor):
+    text = "A Novel\n\nBy Someone\n\nChapter 1\n\nIt began."
+    assert titles(processor, text) == ["Front matter", "Chapter 1"]
+
+
+def test_heading_mid_page_after_a_finished_paragraph(processor):
+    text = "Chapter 1\nIt was a dark night.\nChapter 2\nThe sun rose.\nPART TWO\nChapter 3: Home\n“We are back.”\nCHAPTER IV\nThe end."
+    assert titles(processor, text) == ["Chapter 1", "Chapter 2", "PART TWO", "Chapter 3: Home", "CHAPTER IV"]
+
+
+@pytest.mark.parametrize("line", ["Chapter 2", "chapter 2", "Book One"])
+def test_heading_mid_page_after_a_wrapped_line_is_prose(processor, line):
+    text = f"Chapter 1\nShe had read the whole of\n{line}\nand put it down.\nIt was late."
+    assert titles(processor, text) == ["Chapter 1"]
+
+
+def test_unnumbered_heading_mid_page_is_prose(processor):
+    text = "Chapter 1\nThey talked until dawn.\nEpilogue\nwas the word he used."
+    assert titles(processor, text) == ["Chapter 1"]
+
+
+@pytest.mark.parametrize("chapter_pages", [False, True])
+def test_chapters_survive_pdf_extraction(processor, chapter_pages):
+    import app
+    from benchmarks import harness
+
+    pdf_bytes, _ = harness.synthetic_pdf(harness.synthetic_book(5, paragraphs_per_chapter=3), chapter_pages=chapter_pages)
+    text = app.extract_pdf_text(io.BytesIO(pdf_bytes))
+    assert titles(processor, text) == [f"Chapter {n}" for n in range(1, 6)]
@@ -0,0 +1,57 @@
+import uuid
+from datetime import datetime
+
+import pytest
+
+from benchmarks import harness
+from modules import memory
+from services.llm import CassetteProvider, set_provider
+
+
+def frozen_clock(moment):
+    class Clock(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return moment
+    return Clock
+
+
+def chat_turn(app, message, session_id):
+    app.save_characters(harness.CHARACTERS)
+    return app.app.test_client().post("/chat", data={"message": message, "session_id": session_id})
+
+
+def test_timestamps_do_not_change_the_key():
+    first = CassetteProvider._key("generate", "m", "Recorded at 2026-10-18 09:15:02.\nHello")
+    second = CassetteProvider._key("generate", "m", "Recorded at 2026-10-19T17:40:59.\nHello")
+    assert first == second
+    assert first != CassetteProvider._key("generate", "m", "Recorded at 2026-10-19 17:40:59.\nGoodbye")
+
+
+def test_replay_fails_on_unrecorded_request(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    path.write_text("")
+    with pytest.raises(LookupError):
+        CassetteProvider(str(path), mode="replay").generate("never recorded")
+
+
+def test_chat_turn_records_then_replays(tmp_path, monkeypatch):
+    path = str(tmp_path / "cassette.jsonl")
+    message = "Alice Thorn, where is your brother?"
+
+    # The archive summary prompt carries the current time, which differs between record and replay
+    monkeypatch.setattr(memory, "datetime", frozen_clock(datetime(2026, 10, 18, 9, 15, 2)))
+    set_provider(CassetteProvider(path, mode="record", inner=harness.make_provider()))
+    with harness.quiet(), harness.fresh_app() as app:
+        recorded = chat_turn(app, message, session_id=uuid.uuid4().hex)
+    assert recorded.status_code == 200
+
+    monkeypatch.setattr(memory, "datetime", frozen_clock(datetime(2026, 10, 19, 17, 40, 59)))
+    set_provider(CassetteProvider(path, mode="replay"))
+    try:
+        with harness.quiet(), harness.fresh_app() as app:
+            replayed = chat_turn(app, message, session_id=uuid.uuid4().hex)
+    finally:
+        set_provider(None)
+    assert replayed.status_code == 200, replayed.get_data(as_text=True)
+    assert replayed.get_json() == recorded.get_json()
@@ -0,0 +1,39 @@
+import asyncio
+import io
+
+import pytest
+
+from benchmarks import harness
+from modules.book_processor import BookProcessor
+from services.llm import set_provider
+
+
+@pytest.fixture
+def app():
+    set_provider(harness.make_provider())
+    try:
+        with harness.quiet(), harness.fresh_app() as app:
+            yield app
+    finally:
+        set_provider(None)
+
+
+def test_upload_detects_chapters_and_splits_once(app, monkeypatch):
+    calls = {"detect_chapters": 0, "process_book": 0}
+    for name in calls:
+        original = getattr(BookProcessor, name)
+
+        def counted(self, *args, _name=name, _original=original, **kwargs):
+            calls[_name] += 1
+            return _original(self, *args, **kwargs)
+        monkeypatch.setattr(BookProcessor, name, counted)
+
+    pdf_bytes, _ = harness.synthetic_pdf(harness.synthetic_book(4, paragraphs_per_chapter=4))
+    characters = asyncio.run(app.handle_pdf_upload(io.BytesIO(pdf_bytes)))
+
+    assert calls == {"detect_chapters": 1, "process_book": 1}
+    assert [c["name"] for c in characters] == [c["name"] for c in harness.CHARACTERS]
+    manifest = app.get_components()['ingest'].begin(pdf_bytes)
+    assert manifest["status"] == "complete"
+    assert len(manifest["chapters"]) == 4
+    assert all(manifest["character_index"][c["name"]] for c in harness.CHARACTERS)
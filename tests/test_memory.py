@@ -0,0 +1,33 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from modules.memory import SHORT_TERM_MESSAGES, MemoryManager
+from services.qdrant import QdrantManager
+from services.state import create_state_store
+
+
+@pytest.fixture
+def manager():
+    return MemoryManager(long_term=QdrantManager(), store=create_state_store("memory://"))
+
+
+def test_concurrent_turns_on_one_session_keep_every_message(manager):
+    def turn(i):
+        manager.add_message(f"question {i}", f"answer {i}", session_id="shared")
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(turn, range(30)))
+    messages = manager.history("shared").messages
+    assert len(messages) == 60
+    assert {m.content for m in messages if m.type == "human"} == {f"question {i}" for i in range(30)}
+
+
+def test_archive_trims_to_the_most_recent_messages(manager):
+    for i in range(8):
+        manager.add_message(f"question {i}", f"answer {i}", session_id="s")
+    assert manager.archive_conversation(responder="Alice Thorn", session_id="s")
+    messages = manager.history("s").messages
+    assert len(messages) == SHORT_TERM_MESSAGES
+    assert messages[-1].content == "answer 7"
+    assert manager.history("other").messages == []
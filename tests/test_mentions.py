@@ -0,0 +1,45 @@
+import pytest
+
+from modules.ingest import mention_pattern, usable_name
+
+
+@pytest.mark.parametrize("name", ["Alice Thorn", "Johnny", "Captain Reed", "Dr. Watson", "Hope", "Will"])
+def test_usable_name_accepts_proper_names(name):
+    assert usable_name(name)
+
+
+@pytest.mark.parametrize("name", ["", "  ", "Al", "soldier", "the soldier", "The Soldier", "Mother", "He", "Mr.", "Captain"])
+def test_usable_name_rejects_empty_short_and_generic_names(name):
+    assert not usable_name(name)
+
+
+def test_character_without_usable_name_has_no_pattern():
+    assert mention_pattern({"name": "", "aliases": []}) is None
+    assert mention_pattern({"name": "the narrator", "aliases": ["he", "Mother"]}) is None
+
+
+@pytest.mark.parametrize("name", ["Hope", "Will", "Pip", "Grace", "Rose", "May", "Mark"])
+def test_names_that_are_common_words_do_not_match_the_word(name):
+    pattern = mention_pattern({"name": name})
+    assert not pattern.search(f"I {name.lower()} you {name.lower()} the rest, may we mark it.")
+    assert pattern.search(f"Then {name} left the room.")
+
+
+def test_alias_that_is_a_common_word_matches_only_the_name():
+    pattern = mention_pattern({"name": "Will Turner", "aliases": ["Will"]})
+    assert not pattern.search("I will hope you pip the rest.")
+    assert pattern.search("Will drew his sword.")
+    assert pattern.search("Mr. Will\nTurner arrived.")
+
+
+def test_all_caps_form_matches():
+    pattern = mention_pattern({"name": "Alice Thorn", "aliases": ["Alice"]})
+    assert pattern.search("ALICE THORN")
+    assert pattern.search("she shouted: ALICE!")
+    assert not pattern.search("malice")
+
+
+def test_generic_aliases_are_dropped():
+    pattern = mention_pattern({"name": "John", "aliases": ["the soldier", "he", "Johnny"]})
+    assert not pattern.search("The soldier left, and he was gone.")
+    assert pattern.search("Johnny laughed.")
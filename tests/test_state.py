@@ -0,0 +1,71 @@
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
+
+import pytest
+
+from services.state import create_state_store
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return create_state_store("memory://")
+    return create_state_store(f"sqlite:///{tmp_path / 'state.db'}")
+
+
+def test_list_append_trim_and_get(store):
+    store.append_to_list("messages:a", [{"n": 1}, {"n": 2}])
+    store.append_to_list("messages:a", [{"n": 3}])
+    store.append_to_list("messages:b", [{"n": 9}])
+    assert store.get_list("messages:a") == [{"n": 1}, {"n": 2}, {"n": 3}]
+    store.trim_list("messages:a", 2)
+    assert store.get_list("messages:a") == [{"n": 2}, {"n": 3}]
+    assert store.get_list("messages:b") == [{"n": 9}]
+    store.delete("messages:a")
+    assert store.get_list("messages:a") == []
+
+
+def test_concurrent_appends_keep_every_entry(store):
+    def append(i):
+        store.append_to_list("messages:s", [{"turn": i, "part": 0}, {"turn": i, "part": 1}])
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(append, range(40)))
+    entries = store.get_list("messages:s")
+    assert len(entries) == 80
+    # Each turn's pair stays adjacent and in order
+    assert all(entries[i]["turn"] == entries[i + 1]["turn"] and entries[i]["part"] == 0 for i in range(0, 80, 2))
+
+
+def test_trim_keeps_entries_appended_after_the_read(store):
+    store.append_to_list("messages:s", [{"n": n} for n in range(12)])
+    snapshot = store.get_list("messages:s")
+    store.append_to_list("messages:s", [{"n": 12}, {"n": 13}])  # another turn in between
+    store.trim_list("messages:s", 10)
+    assert len(snapshot) == 12
+    assert store.get_list("messages:s")[-2:] == [{"n": 12}, {"n": 13}]
+
+
+def test_set_union_and_size(store):
+    store.add_to_set("character_index:Alice", ["p1", "p2"])
+    store.add_to_set("character_index:Alice", ["p2", "p3"])
+    assert store.set_size("character_index:Alice") == 3
+    assert store.set_size("character_index:Bram") == 0
+
+
+def _append_from_process(args):
+    path, worker = args
+    store = create_state_store(f"sqlite:///{path}")
+    for turn in range(20):
+        store.append_to_list("messages:shared", [{"worker": worker, "turn": turn}])
+        store.add_to_set("character_index:Alice", [f"{worker}-{turn}"])
+
+
+def test_sqlite_appends_from_several_processes(tmp_path):
+    path = str(tmp_path / "state.db")
+    create_state_store(f"sqlite:///{path}")
+    with Pool(4) as pool:
+        pool.map(_append_from_process, [(path, worker) for worker in range(4)])
+    store = create_state_store(f"sqlite:///{path}")
+    assert len(store.get_list("messages:shared")) == 80
+    assert store.set_size("character_index:Alice") == 80